@@ -1,11 +1,22 @@
+import asyncio
 import hashlib
 import logging
 import random
 import struct
+import time
 from datetime import datetime, timezone
 from enum import Enum
-from custom_components.alsavopro.const import MODE_TO_CONFIG, NO_WATER_FLUX, WATER_TEMP_TOO_LOW, MAX_UPDATE_RETRIES, \
-     MAX_SET_CONFIG_RETRIES
+from custom_components.alsavopro.const import MODE_TO_CONFIG, NO_WATER_FLUX, WATER_TEMP_TOO_LOW, RETRY_ATTEMPTS, \
+     RETRY_BASE_DELAY, RETRY_MAX_DELAY, BREAKER_FAILURE_THRESHOLD, BREAKER_RESET_TIMEOUT, BREAKER_MAX_RESET_TIMEOUT, \
+     SESSION_MAX_IDLE, POLL_GROUPS, POLL_GROUP_CONFIG, CLOUD_IP, WINDOWED_QUERY_MAX_FAILURES, WRITE_ACK_MAX_MISSES
+from . import registers
+from .codec import PacketHeader, AuthIntro, AuthChallenge, AuthResponse, CMD_DATA, QUERY_ALL, \
+    encode_packet, encode_set_config, encode_set_configs, encode_query, encode_query_response, KIND_STATUS, \
+    KIND_CONFIG
+from .metrics import DeviceMetrics
+from .ratecontrol import PRIORITY_POLL, PRIORITY_WRITE
+from .retry import RetryPolicy, CircuitBreaker, CircuitOpenError
+from .scheduler import PollScheduler, RegisterGroup
 from .udpclient import UDPClient
 
 _LOGGER = logging.getLogger(__name__)
@@ -14,7 +25,8 @@ _LOGGER = logging.getLogger(__name__)
 class AlsavoPro:
     """Alsavo Pro data handler."""
 
-    def __init__(self, name, serial_no, ip_address, port_no, password):
+    def __init__(self, name, serial_no, ip_address, port_no, password, session_max_idle=SESSION_MAX_IDLE,
+                 shared_socket=None):
         """Init Alsavo Pro data handler."""
         self._name = name
         self._serial_no = serial_no
@@ -22,49 +34,273 @@ class AlsavoPro:
         self._port_no = port_no
         self._password = password
         self._data = QueryResponse(0, 0)
-        self._session = AlsavoSocketCom()
-        self._set_retries = 0
-        self._update_retries = 0
+        # Cloud sessions share one socket to the relay unless told otherwise
+        if shared_socket is None:
+            shared_socket = ip_address == CLOUD_IP
+        self._session = AlsavoSocketCom(session_max_idle, shared_socket)
+        self._retry_policy = RetryPolicy(RETRY_ATTEMPTS, RETRY_BASE_DELAY, RETRY_MAX_DELAY)
+        self._breaker = CircuitBreaker(BREAKER_FAILURE_THRESHOLD, BREAKER_RESET_TIMEOUT, BREAKER_MAX_RESET_TIMEOUT)
+        self._scheduler = PollScheduler([RegisterGroup(name, interval, windows)
+                                         for name, (interval, windows) in POLL_GROUPS.items()])
+        self._interest = None
+        self._pending_writes = {}
+        self._write_done = None
+        self._write_tasks = set()
+        self._optimistic = {}
+        self._rollback = {}
+        self._local_change_listener = None
+        self._session_lock = asyncio.Lock()
+        self._update_task = None
+        self._closed = False
         self._online = False
+        self._last_updated = None
+        self._restored = False
+
+    def set_local_change_listener(self, listener):
+        """ Callback invoked when registers change outside a poll, e.g. by an optimistic write """
+        self._local_change_listener = listener
+
+    def _notify_local_change(self):
+        if self._local_change_listener is not None:
+            self._local_change_listener()
+
+    def _set_data(self, data):
+        """ Replace the register data, keeping values of writes that are still in flight """
+        if self._optimistic:
+            data = data.with_config_values(self._optimistic)
+        self._data = data
+
+    def set_register_interest(self, status_registers, config_registers):
+        """ Limit polling to the registers read by enabled entities """
+        self._interest = {KIND_STATUS: frozenset(status_registers), KIND_CONFIG: frozenset(config_registers)}
+
+    def expire_poll_group(self, name):
+        """ Fetch a register group on the next poll even if it is not due yet """
+        self._scheduler.expire(name)
+
+    async def refresh_config(self):
+        """ Re-read only the config registers, e.g. to confirm a write """
+        _LOGGER.debug("refresh_config")
+        try:
+            await self._run(self._poll_config, poll=True)
+            self._online = True
+        except Exception as e:
+            _LOGGER.error(f"Unable to refresh config: {e}")
+            self._online = False
+
+    async def _poll_config(self):
+        await self._ensure_session()
+        group = next(group for group in self._scheduler.groups if group.name == POLL_GROUP_CONFIG)
+        windows = list(group.windows_for(self._interest))
+        if windows:
+            self._set_data(self._data.merged(await self._session.query_windows(windows)))
+        self._scheduler.mark_polled([group])
 
     async def update(self):
+        """ Poll the heat pump, concurrent callers share the poll already in flight """
+        if self._update_task is None:
+            self._update_task = asyncio.ensure_future(self._update())
+            self._update_task.add_done_callback(self._update_done)
+        await asyncio.shield(self._update_task)
+
+    def _update_done(self, task):
+        if self._update_task is task:
+            self._update_task = None
+
+    async def _update(self):
         _LOGGER.debug(f"update")
         try:
-            await self._session.connect(self._ip_address, int(self._port_no), int(self._serial_no), self._password)
-            data = await self._session.query_all()
-            if data is not None:
-                self._data = data
-                self._online = True
-                self._update_retries = 0
+            self._set_data(await self._run(self._poll, poll=True))
+            self._online = True
+            self._last_updated = datetime.now(timezone.utc)
+        except CircuitOpenError:
+            _LOGGER.debug("Heat pump unreachable, skipping poll until the next probe")
+            self._online = False
         except Exception as e:
-            if self._update_retries < MAX_UPDATE_RETRIES:
-                self._update_retries += 1
-                await self.update()
-            else:
-                self._update_retries = 0
-                _LOGGER.error(f"Unable to update: {e}")
-                self._online = False
+            _LOGGER.error(f"Unable to update: {e}")
+            self._online = False
+        finally:
+            self.metrics.record_poll(self._online)
+            self._restored = False
+
+    def restore(self, data: bytes, last_updated: datetime) -> bool:
+        """ Start from a snapshot saved by a previous run, until the first poll completes """
+        """ Returns False if the snapshot can't be parsed. """
+        try:
+            self._data = QueryResponse.unpack(data)
+        except (ValueError, struct.error) as e:
+            _LOGGER.warning(f"Ignoring unreadable saved snapshot: {e}")
+            return False
+        self._last_updated = last_updated
+        self._restored = True
+        return True
+
+    def snapshot(self) -> bytes:
+        """ Current registers in the query response format, for restore() """
+        return self._data.pack()
 
     async def set_config(self, idx: int, value: int):
         _LOGGER.debug(f"set_config({idx}, {value})")
+        await self.set_configs({idx: value})
+
+    async def set_configs(self, values: dict):
+        """ Write several config registers, writes issued in the same event loop iteration share one packet """
+        """ The values are applied to the local registers right away and rolled back if the write fails. """
+        for idx in values:
+            if idx not in self._optimistic:
+                self._rollback[idx] = self._data.config.unsigned(idx)
+        self._optimistic.update(values)
+        self._data = self._data.with_config_values(values)
+        self._notify_local_change()
+
+        self._pending_writes.update(values)
+        if self._write_done is None:
+            loop = asyncio.get_running_loop()
+            self._write_done = loop.create_future()
+            loop.call_soon(self._start_write)
+        await asyncio.shield(self._write_done)
+
+    def _start_write(self):
+        values, done = self._pending_writes, self._write_done
+        self._pending_writes, self._write_done = {}, None
+        task = asyncio.ensure_future(self._write(values, done))
+        self._write_tasks.add(task)
+        task.add_done_callback(self._write_tasks.discard)
+
+    async def _write(self, values, done):
+        read_back = None
+        failed = False
         try:
-            await self._session.connect(self._ip_address, int(self._port_no), int(self._serial_no), self._password)
-            await self._session.set_config(idx, value)
+            read_back = await self._run(lambda: self._set_configs(values))
             self._online = True
-            self._set_retries = 0
         except Exception as e:
-            if self._set_retries < MAX_SET_CONFIG_RETRIES:
-                self._set_retries += 1
-                await self.set_config(idx, value)
+            _LOGGER.error(f"Unable to set config: {values} Error: {e}")
+            self._online = False
+            failed = True
+        finally:
+            # Values overwritten by a later write stay optimistic until that write completes
+            settled = {idx: value for idx, value in values.items() if self._optimistic.get(idx) == value}
+            for idx in settled:
+                del self._optimistic[idx]
+            rollback = {idx: self._rollback.pop(idx) for idx in settled}
+            if failed:
+                self._data = self._data.with_config_values(rollback)
+                self._notify_local_change()
+            elif read_back is not None:
+                self._set_data(self._data.merged(read_back))
+            done.set_result(None)
+
+    async def _poll(self):
+        """ Fetch the register groups that are due, or everything when all of them are """
+        if await self._ensure_session():
+            self._scheduler.reset()
+        groups = self._scheduler.due()
+        windows = [window for group in groups for window in group.windows_for(self._interest)]
+        try:
+            if groups.__len__() == self._scheduler.groups.__len__():
+                data = await self._session.query_all()
+            elif windows:
+                data = self._data.merged(await self._session.query_windows(windows))
             else:
-                self._set_retries = 0
-                _LOGGER.error(f"Unable to set config: {idx}, {value} Error: {e}")
-                self._online = False
+                data = self._data
+        except Exception:
+            # Fall back to a full query on the next attempt
+            self._scheduler.reset()
+            raise
+        self._scheduler.mark_polled(groups)
+        _LOGGER.debug(f"Polled {', '.join(group.name for group in groups)}")
+        return data
+
+    async def _set_configs(self, values):
+        await self._ensure_session()
+        return await self._session.set_configs(values)
+
+    async def _run(self, operation, poll=False):
+        """ Run operation with backoff between attempts, guarded by the circuit breaker """
+        """ Polls are refused while the breaker is open and get a single attempt as half-open probe. """
+        """ Writes are never refused, but only get a single attempt unless the breaker is closed. """
+        allowed = self._breaker.allow_request()
+        if poll and not allowed:
+            raise CircuitOpenError("Circuit breaker open")
+        attempts = self._retry_policy.attempts if self._breaker.is_closed else 1
+
+        for attempt in range(attempts):
+            try:
+                result = await operation()
+                self._breaker.record_success()
+                return result
+            except Exception as e:
+                if attempt + 1 == attempts:
+                    self._breaker.record_failure()
+                    raise
+                delay = self._retry_policy.delay(attempt)
+                self.metrics.retries += 1
+                _LOGGER.debug(f"Attempt {attempt + 1} failed ({e}), retrying in {delay:.2f}s")
+                await asyncio.sleep(delay)
+
+    async def _ensure_session(self):
+        """ Authenticate unless the current session is still usable, returns True if a new session was set up """
+        """ Only one handshake runs at a time; operations waiting for it reuse the session it set up. """
+        async with self._session_lock:
+            if self._closed:
+                raise ConnectionError("Handler closed")
+            if not self._session.is_session_valid:
+                await self._session.connect(self._ip_address, int(self._port_no), int(self._serial_no),
+                                            self._password)
+                return True
+            return False
+
+    def close(self):
+        """ Release the socket held for this device """
+        """ Polls and writes in flight are cancelled, so none of them opens a new socket afterwards. """
+        self._closed = True
+        if self._update_task is not None:
+            self._update_task.cancel()
+        for task in list(self._write_tasks):
+            task.cancel()
+        self._session.close()
 
     @property
     def is_online(self) -> bool:
         return self._online and self._data.parts > 0
 
+    @property
+    def is_restored(self) -> bool:
+        """ True while the registers come from a saved snapshot and no poll has completed yet """
+        return self._restored
+
+    @property
+    def is_available(self) -> bool:
+        """ True if there are registers to show, live or restored """
+        return self.is_online or self._restored
+
+    @property
+    def last_updated(self):
+        """ Time of the last successful poll, or of the restored snapshot """
+        return self._last_updated
+
+    @property
+    def rtt(self):
+        return self._session.rtt
+
+    @property
+    def metrics(self):
+        """ Latencies and poll outcomes of this device """
+        return self._session.metrics
+
+    @property
+    def retransmissions(self):
+        """ Requests re-sent for lack of a reply, counted since the socket was opened """
+        return self._session.retransmissions
+
+    @property
+    def status_registers(self):
+        return self._data.status
+
+    @property
+    def config_registers(self):
+        return self._data.config
+
     @property
     def unique_id(self):
         return f"{self._name}_{self._serial_no}"
@@ -79,16 +315,16 @@ class AlsavoPro:
             await self.set_config(config_key, int(value * 10))
 
     def get_status_value(self, idx: int):
-        return self._data.get_status_value(idx)
+        return self._data.status.unsigned(idx)
 
     def get_config_value(self, idx: int):
-        return self._data.get_config_value(idx)
+        return self._data.config.unsigned(idx)
 
     def get_temperature_from_status(self, idx):
-        return self._data.get_status_temperature_value(idx)
+        return self._data.status.temperature(idx)
 
     def get_temperature_from_config(self, idx):
-        return self._data.get_config_temperature_value(idx)
+        return self._data.config.temperature(idx)
 
     @property
     def water_in_temperature(self):
@@ -104,39 +340,39 @@ class AlsavoPro:
 
     @property
     def operating_mode(self):
-        return self._data.get_config_value(4) & 3
+        return self._data.config.unsigned(4) & 3
 
     @property
     def is_timer_on_enabled(self):
-        return self._data.get_config_value(4) & 4 == 4
+        return self._data.config.unsigned(4) & 4 == 4
 
     @property
     def water_pump_running_mode(self):
-        return self._data.get_config_value(4) & 8 == 8
+        return self._data.config.unsigned(4) & 8 == 8
 
     @property
     def electronic_valve_style(self):
-        return self._data.get_config_value(4) & 16 == 16
+        return self._data.config.unsigned(4) & 16 == 16
 
     @property
     def is_power_on(self):
-        return self._data.get_config_value(4) & 32 == 32
+        return self._data.config.unsigned(4) & 32 == 32
 
     @property
     def power_mode(self):
-        return self._data.get_config_value(16)
+        return self._data.config.unsigned(16)
 
     @property
     def is_debug_mode(self):
-        return self._data.get_config_value(4) & 64 == 64
+        return self._data.config.unsigned(4) & 64 == 64
 
     @property
     def is_timer_off_enabled(self):
-        return self._data.get_config_value(4) & 128 == 128
+        return self._data.config.unsigned(4) & 128 == 128
 
     @property
     def manual_defrost(self):
-        return self._data.get_config_value(5) & 1 == 1
+        return self._data.config.unsigned(5) & 1 == 1
 
     @property
     def is_frost_protection(self):
@@ -152,16 +388,16 @@ class AlsavoPro:
         return error
 
     async def set_power_off(self):
-        await self.set_config(4, self._data.get_config_value(4) & 0xFFDF)
+        await self.set_config(4, self._data.config.unsigned(4) & 0xFFDF)
 
     async def set_cooling_mode(self):
-        await self.set_config(4, (self._data.get_config_value(4) & 0xFFDC) + 32)
+        await self.set_config(4, (self._data.config.unsigned(4) & 0xFFDC) + 32)
 
     async def set_heating_mode(self):
-        await self.set_config(4, (self._data.get_config_value(4) & 0xFFDC) + 33)
+        await self.set_config(4, (self._data.config.unsigned(4) & 0xFFDC) + 33)
 
     async def set_auto_mode(self):
-        await self.set_config(4, (self._data.get_config_value(4) & 0xFFDC) + 34)
+        await self.set_config(4, (self._data.config.unsigned(4) & 0xFFDC) + 34)
 
     async def set_power_mode(self, value: int):
         await self.set_config(16, value)
@@ -175,118 +411,9 @@ class AlsavoPro:
         return self._serial_no
 
 
-class PacketHeader:
-    """ This is the packet header """
-    """ It consists of 16 bytes and have the following attributes: """
-    """ - hdr - byte - 0x32 = request, 0x30 = response """
-    """ - pad - byte - Padding. Always 0 """
-    """ - seq - Int16 - Sequence number (monotonically increasing once session has been set up, otherwise 0) """
-    """ - csid - Int32 - ??? """
-    """ - dsid - Int32 - ??? """
-    """ - cmd - Int16 - Command """
-    """ - Payload length - Int16 - """
-
-    def __init__(self, hdr, seq, csid, dsid, cmd, payload_length):
-        self.hdr = hdr
-        self.pad = 0
-        self.seq = seq
-        self.csid = csid
-        self.dsid = dsid
-        self.cmd = cmd
-        self.payloadLength = payload_length
-
-    @property
-    def is_reply(self):
-        return (self.hdr & 2) == 0
-
-    def pack(self):
-        # Struct format: char, char, uint16, uint32, uint32, uint16, uint16
-        return struct.pack('!BBHIIHH', self.hdr, self.pad, self.seq, self.csid, self.dsid, self.cmd, self.payloadLength)
-
-    @staticmethod
-    def unpack(data):
-        unpacked_data = struct.unpack('!BBHIIHH', data)
-        return PacketHeader(unpacked_data[0], unpacked_data[2], unpacked_data[3], unpacked_data[4], unpacked_data[5],
-                            unpacked_data[6])
-
-
-class Timestamp:
-    def __init__(self):
-        current_time = datetime.now(timezone.utc)
-        self.year = current_time.year
-        self.month = current_time.month
-        self.day = current_time.day
-        self.hour = current_time.hour
-        self.min = current_time.minute
-        self.sec = current_time.second
-        self.tz = 2  # Placeholder
-
-    def pack(self):
-        # Struct format: uint16, char, char, char, char, char, char
-        return struct.pack('!HBBBBBB', self.year, self.month, self.day, self.hour, self.min, self.sec, self.tz)
-
-
-class AuthIntro:
-    def __init__(self, client_token, serial_inv):
-        self.hdr = PacketHeader(0x32, 0, 0, 0, 0xf2, 0x28)
-        self.act1, self.act2, self.act3, self.act4 = 1, 1, 2, 0
-        self.clientToken = client_token
-        self.pumpSerial = serial_inv
-        self._uuid = [0x97e8ced0, 0xf83640bc, 0xb4dd57e3, 0x22adc3a0]
-        self.timestamp = Timestamp()
-
-    def pack(self):
-        packed_hdr = self.hdr.pack()
-        packed_uuid = struct.pack('!IIII', *self._uuid)
-        packed_data = struct.pack('!BBBBIQ', self.act1, self.act2, self.act3, self.act4, self.clientToken,
-                                  self.pumpSerial) + packed_uuid + self.timestamp.pack()
-        return packed_hdr + packed_data
-
-
-class AuthChallenge:
-    def __init__(self, hdr, act1, act2, act3, act4, server_token):
-        self.hdr = hdr
-        self.act1 = act1
-        self.act2 = act2
-        self.act3 = act3
-        self.act4 = act4
-        self.serverToken = server_token
-
-    @staticmethod
-    def unpack(data):
-        # 16 first bytes are header
-        packet_hdr = PacketHeader.unpack(data[0:16])
-
-        # Define the format string for unpacking
-        format_string = '!BBBBI'  # Adjust to match your structure
-
-        # Unpack the serialized data
-        unpacked_data = struct.unpack(format_string, data[16:24])
-
-        # Create a new instance of the class and initialize its attributes
-        obj = AuthChallenge(packet_hdr, unpacked_data[0], unpacked_data[1], unpacked_data[2], unpacked_data[3],
-                            unpacked_data[4])
-
-        return obj
-
-    @property
-    def is_authorized(self):
-        return self.act1 == 3 and self.act2 == 0 and self.act3 == 0 and self.act4 == 0
-
-
-class AuthResponse:
-    def __init__(self, csid, dsid, resp):
-        # Header fields
-        self.hdr = PacketHeader(0x32, 0, csid, dsid, 0xf2, 0x1c)
-        self.act1, self.act2, self.act3, self.act4 = 4, 0, 0, 3
-        self.timestamp = Timestamp()
-
-        # Response field (as a bytes object)
-        self.response = bytes(resp)
-
-    def pack(self):
-        packed_data = struct.pack('!BBBB', self.act1, self.act2, self.act3, self.act4)
-        return self.hdr.pack() + packed_data + self.response + self.timestamp.pack()
+_QUERY_RESPONSE_HEADER = struct.Struct('!BBH')
+_PAYLOAD_HEADER = struct.Struct('!IHH')
+_REGISTER_WINDOW = struct.Struct('!HH')
 
 
 class Payload:
@@ -298,23 +425,34 @@ class Payload:
         self.size = size
         self.startIdx = start_idx
         self.indices = indices
-        self.data = []
+        self.registers = registers.EMPTY
 
     def get_value(self, idx):
-        if idx - self.startIdx < 0 or idx - self.startIdx > self.data.__len__():
-            return 0
-        return self.data[idx - self.startIdx]
+        return self.registers.unsigned(idx)
 
     @staticmethod
-    def unpack(data):
-        unpacked_data = struct.unpack('!IHHHH', data[0:12])
-        obj = Payload(unpacked_data[0], unpacked_data[1], unpacked_data[2], unpacked_data[3], unpacked_data[4])
-        if obj.subType == 1 or obj.subType == 2:
-            obj.data = struct.unpack('>' + 'H' * (obj.size // 2), data[12:12 + obj.size])
+    def unpack(data, offset=0):
+        """ Unpack the payload starting at offset in data, a bytes-like object or memoryview """
+        """ Each payload is 8 header bytes followed by size bytes, where status and config payloads """
+        """ start with startIdx and indices before the register values. """
+        if offset + _PAYLOAD_HEADER.size > data.__len__():
+            raise ValueError(f"Truncated payload header at offset {offset}")
+        data_type, sub_type, size = _PAYLOAD_HEADER.unpack_from(data, offset)
+        start = offset + _PAYLOAD_HEADER.size
+        end = start + size
+        if end > data.__len__():
+            raise ValueError(f"Payload at offset {offset} claims {size} bytes, only {data.__len__() - start} left")
+        view = memoryview(data)
+        if sub_type == 1 or sub_type == 2:
+            if size < _REGISTER_WINDOW.size:
+                raise ValueError(f"Register payload at offset {offset} too short ({size} bytes)")
+            start_idx, indices = _REGISTER_WINDOW.unpack_from(data, start)
+            obj = Payload(data_type, sub_type, size, start_idx, indices)
+            start += _REGISTER_WINDOW.size
         else:
-            obj.startIdx = 0
-            obj.indices = 0
-            obj.data = struct.unpack('>' + 'H' * (obj.size // 2), data[8:8 + obj.size])
+            obj = Payload(data_type, sub_type, size, 0, 0)
+        count = (end - start) // 2
+        obj.registers = registers.RegisterSnapshot.from_buffer(obj.startIdx, view[start:start + 2 * count])
         return obj
 
 
@@ -326,58 +464,80 @@ class QueryResponse:
         self.action = action
         self.parts = parts
         self.__payloads = []
-        self.__status = None
-        self.__config = None
-        self.__deviceInfo = None
+        self.status = registers.EMPTY
+        self.config = registers.EMPTY
+        self.device_info = registers.EMPTY
 
     def get_status_value(self, idx: int):
-        if self.__status is None:
-            return 0
-        else:
-            return self.__status.get_value(idx)
+        return self.status.unsigned(idx)
 
     def get_config_value(self, idx: int):
-        if self.__config is None:
-            return 0
-        else:
-            return self.__config.get_value(idx)
+        return self.config.unsigned(idx)
 
     def get_signed_status_value(self, idx: int):
-        unsigned_int = self.get_status_value(idx)
-        if unsigned_int > 32767:
-            return unsigned_int - 65536
-        else:
-            return unsigned_int
+        return self.status.signed(idx)
 
     def get_signed_config_value(self, idx: int):
-        unsigned_int = self.get_config_value(idx)
-        if unsigned_int > 32767:
-            return unsigned_int - 65536
-        else:
-            return unsigned_int
+        return self.config.signed(idx)
 
     def get_status_temperature_value(self, idx: int):
-        return self.get_signed_status_value(idx) / 10
+        return self.status.temperature(idx)
 
     def get_config_temperature_value(self, idx: int):
-        return self.get_signed_config_value(idx) / 10
+        return self.config.temperature(idx)
+
+    def with_config_values(self, values):
+        """ Copy with config registers replaced, e.g. by values the pump confirmed writing """
+        obj = QueryResponse(self.action, self.parts)
+        obj.__payloads = self.__payloads
+        obj.status = self.status
+        obj.config = self.config.with_values(values)
+        obj.device_info = self.device_info
+        return obj
+
+    def covers(self, windows):
+        """ True if the response holds all registers of the (kind, start_idx, count) windows """
+        for kind, start_idx, count in windows:
+            block = self.status if kind == KIND_STATUS else self.config
+            if not block.covers(start_idx, count):
+                return False
+        return True
+
+    def merged(self, other):
+        """ Registers of this response updated with those present in other, e.g. a partial query """
+        obj = QueryResponse(other.action, max(self.parts, other.parts))
+        obj.__payloads = other.__payloads
+        obj.status = self.status.merge(other.status)
+        obj.config = self.config.merge(other.config)
+        obj.device_info = self.device_info.merge(other.device_info)
+        return obj
+
+    def pack(self):
+        """ Encode status, config and device info as a query response, the inverse of unpack """
+        parts = ((KIND_STATUS, self.status), (KIND_CONFIG, self.config), (3, self.device_info))
+        return encode_query_response(self.action, [(sub_type, snapshot.start, snapshot.to_bytes())
+                                                   for sub_type, snapshot in parts if snapshot.__len__()])
 
     @staticmethod
     def unpack(data):
-        unpacked_data = struct.unpack('!BBH', data[0:4])
-        obj = QueryResponse(unpacked_data[0], unpacked_data[1])
-        idx = 4
-
-        while idx < data.__len__():
-            payload = Payload.unpack(data[idx:])
+        """ Parse a query response, walking a single memoryview without copying the buffer """
+        view = memoryview(data)
+        if view.__len__() < _QUERY_RESPONSE_HEADER.size:
+            raise ValueError("Truncated query response")
+        action, parts, _ = _QUERY_RESPONSE_HEADER.unpack_from(view)
+        obj = QueryResponse(action, parts)
+        idx = _QUERY_RESPONSE_HEADER.size
+
+        while idx < view.__len__():
+            payload = Payload.unpack(view, idx)
             if payload.subType == 1:
-                obj.__status = payload
+                obj.status = obj.status.merge(payload.registers)
             elif payload.subType == 2:
-                obj.__config = payload
-            if payload.subType == 3:
-                obj.__deviceInfo = payload
+                obj.config = obj.config.merge(payload.registers)
+            elif payload.subType == 3:
+                obj.device_info = payload.registers
             obj.__payloads.append(payload)
-            idx += payload.size + 8
+            idx += payload.size + _PAYLOAD_HEADER.size
 
         return obj
 
@@ -398,7 +558,7 @@ class AlsavoSocketCom:
     """ Socket communication handler for the Alsavo Pro integration """
     """ Everything is pull-based. """
 
-    def __init__(self):
+    def __init__(self, session_max_idle=SESSION_MAX_IDLE, shared_socket=False):
         self.serverToken = None
         self.DSIS = None
         self.CSID = None
@@ -407,10 +567,60 @@ class AlsavoSocketCom:
         self.clientToken = None
         self.lstConfigReqTime = None
         self.client = None
+        self.status = ConnectionStatus.Disconnected
+        self.session_max_idle = session_max_idle
+        self.lastActivity = None
+        self.seq = 0
+        self.writesAcknowledged = None
+        self.writeAckMisses = 0
+        self.windowedQueries = None
+        self.windowedQueryFailures = 0
+        self.sharedSocket = shared_socket
+        self.metrics = DeviceMetrics()
+
+    def next_seq(self):
+        """ Next packet sequence number, wrapping within 1..0xffff as 0 is reserved for the handshake """
+        self.seq = self.seq % 0xffff + 1
+        return self.seq
 
-    async def send_and_receive(self, bytes_to_send):
+    @property
+    def rtt(self):
+        """ Smoothed round trip time to the pump in seconds """
+        return self.client.rtt if self.client is not None else None
+
+    @property
+    def retransmissions(self):
+        return self.client.retransmissions if self.client is not None else 0
+
+    @property
+    def is_session_valid(self):
+        """ True while the authenticated session can be reused without a new handshake """
+        return (self.status == ConnectionStatus.Connected
+                and time.monotonic() - self.lastActivity < self.session_max_idle)
+
+    def invalidate(self, csid=None):
+        """ Forget the session so the next operation re-authenticates """
+        """ With csid given, only if that is still the current session and not one set up meanwhile. """
+        if csid is not None and csid != self.CSID:
+            return
+        if self.status == ConnectionStatus.Connected:
+            _LOGGER.debug("Session invalidated")
+        self.status = ConnectionStatus.Disconnected
+        self.CSID = None
+        self.DSIS = None
+        self.serverToken = None
+
+    def close(self):
+        """ Close the UDP endpoint """
+        self.invalidate()
+        if self.client is not None:
+            self.client.close()
+            self.client = None
+
+    async def send_and_receive(self, bytes_to_send, key=None, priority=PRIORITY_POLL, congestion_signal=True):
         _LOGGER.debug(f"send_and_receive())")
-        response = await self.client.send_rcv(bytes_to_send)
+        response = await self.client.send_rcv(bytes_to_send, key, priority=priority,
+                                              congestion_signal=congestion_signal)
         _LOGGER.debug(f"Received response")
         return response
 
@@ -420,51 +630,141 @@ class AlsavoSocketCom:
 
     async def get_auth_challenge(self):
         auth_intro = AuthIntro(self.clientToken, self.serialQ)
-        response = await self.send_and_receive(bytes(auth_intro.pack()))
+        response = await self.send_and_receive(auth_intro.pack(), (None, 0))
         return AuthChallenge.unpack(response[0])
 
     async def send_auth_response(self, ctx):
         resp = AuthResponse(self.CSID, self.DSIS, ctx.digest())
-        return await self.send_and_receive(resp.pack())
+        return await self.send_and_receive(resp.pack(), (self.CSID, 0))
 
-    async def send_and_rcv_packet(self, payload: bytes, cmd=0xf4):
+    async def send_and_rcv_packet(self, payload: bytes, cmd=CMD_DATA, priority=PRIORITY_POLL,
+                                  congestion_signal=True):
         _LOGGER.debug(f"send_and_rcv_packet(payload, {cmd})")
         if self.CSID is not None and self.DSIS is not None:
-            return await self.send_and_receive(
-                PacketHeader(0x32, 0, self.CSID, self.DSIS, cmd, payload.__len__()).pack() + payload
+            seq = self.next_seq()
+            csid = self.CSID
+            resp = await self.send_and_receive(
+                encode_packet(seq, csid, self.DSIS, cmd, payload),
+                (csid, seq),
+                priority,
+                congestion_signal
             )
+            if resp is None:
+                return None
+            if resp[0].__len__() < 16 or PacketHeader.unpack(resp[0]).cmd != cmd:
+                # The pump answers with something else than our command when it no longer knows the session
+                self.invalidate(csid)
+                raise ConnectionError("Packet rejected by heat pump, session invalidated")
+            self.lastActivity = time.monotonic()
+            return resp
         return None
 
-    async def send_packet(self, payload: bytes, cmd=0xf4):
+    async def send_packet(self, payload: bytes, cmd=CMD_DATA):
         _LOGGER.debug(f"send_packet(payload, {cmd})")
         if self.CSID is not None and self.DSIS is not None:
-            await self.send(PacketHeader(0x32, 0, self.CSID, self.DSIS, cmd, payload.__len__()).pack() + payload)
+            await self.send(encode_packet(self.next_seq(), self.CSID, self.DSIS, cmd, payload))
 
-    async def query_all(self):
+    async def query_all(self, priority=PRIORITY_POLL):
         """ Query all information from the heat pump """
         _LOGGER.debug("socket.query_all")
-        resp = await self.send_and_rcv_packet(b'\x08\x01\x00\x00\x00\x02\x00\x2e\xff\xff\x00\x00')
+        data = await self.query(QUERY_ALL, priority)
+        if self.windowedQueries is None and self.windowedQueryFailures >= WINDOWED_QUERY_MAX_FAILURES:
+            # The pump answers, just not windowed queries
+            _LOGGER.debug("Heat pump does not answer windowed queries, querying all registers instead")
+            self.windowedQueries = False
+        return data
+
+    async def query_registers(self, kind: int, start_idx: int, count: int, priority=PRIORITY_POLL):
+        """ Query count registers of kind (KIND_STATUS or KIND_CONFIG) starting at start_idx """
+        _LOGGER.debug(f"socket.query_registers({kind}, {start_idx}, {count})")
+        return await self.query_windows(((kind, start_idx, count),), priority)
+
+    async def query_windows(self, windows, priority=PRIORITY_POLL):
+        """ Query (kind, start_idx, count) register windows in one packet """
+        """ A response without the requested registers is replaced by a full query. Pumps whose windowed """
+        """ queries fail WINDOWED_QUERY_MAX_FAILURES times in a row while full queries succeed are sent full """
+        """ queries from then on, the response then holds the windows along with everything else. """
+        if self.windowedQueries is False:
+            return await self.query_all(priority)
+        try:
+            data = await self.query(encode_query(windows), priority)
+        except ConnectionError:
+            self.windowedQueryFailures += 1
+            raise
+        if not data.covers(windows):
+            _LOGGER.debug("Windowed query answered without the requested registers, querying all registers")
+            self.windowedQueryFailures += 1
+            return await self.query_all(priority)
+        self.windowedQueries = True
+        self.windowedQueryFailures = 0
+        return data
+
+    async def query(self, payload: bytes, priority=PRIORITY_POLL):
+        """ Send a query payload and parse the response """
+        csid = self.CSID
+        resp = await self.send_and_rcv_packet(payload, priority=priority)
         self.lstConfigReqTime = datetime.now()
         if resp is None:
-            raise Exception("query_all: no response")
-        return QueryResponse.unpack(resp[0][16:])
+            self.invalidate(csid)
+            raise ConnectionError("query: no response")
+        # Round trip of the transmission that got the reply, without waiting for a slot or retransmissions
+        if resp[1] is not None:
+            self.metrics.query.add(resp[1])
+        received = time.monotonic()
+        data = QueryResponse.unpack(memoryview(resp[0])[16:])
+        self.metrics.parse.add(time.monotonic() - received)
+        return data
 
     async def set_config(self, idx: int, value: int):
         """ Set configuration values on the heat pump """
         _LOGGER.debug(f"socket.set_config({idx}, {value})")
-        idx_h = ((idx >> 8) & 0xff).to_bytes(1, 'big')
-        idx_l = (idx & 0xff).to_bytes(1, 'big')
-        val_h = ((value >> 8) & 0xff).to_bytes(1, 'big')
-        val_l = (value & 0xff).to_bytes(1, 'big')
-        await self.send_packet(b'\x09\x01\x00\x00\x00\x02\x00\x2e\x00\x02\x00\x04' + idx_h + idx_l + val_h + val_l)
+        await self.send_packet(encode_set_config(idx, value))
+
+    async def set_configs(self, values: dict):
+        """ Set several configuration values in one packet and wait until the pump confirmed them """
+        """ A reply to the write counts as acknowledgement. Without one the registers are read back and """
+        """ compared; pumps not replying to WRITE_ACK_MAX_MISSES applied writes in a row are not waited for again. """
+        """ Returns the read back response, or None if the write was acknowledged. """
+        _LOGGER.debug(f"socket.set_configs({values})")
+        started = time.monotonic()
+        payload = encode_set_configs(values)
+        if self.writesAcknowledged is not False:
+            # Until the pump acknowledged a write, a missing acknowledgement says nothing about congestion
+            if await self.send_and_rcv_packet(payload, priority=PRIORITY_WRITE,
+                                              congestion_signal=self.writesAcknowledged is True) is not None:
+                self.writesAcknowledged = True
+                self.writeAckMisses = 0
+                self.metrics.write.add(time.monotonic() - started)
+                return None
+        else:
+            await self.send_packet(payload)
+
+        start_idx = min(values)
+        data = await self.query_registers(KIND_CONFIG, start_idx, max(values) - start_idx + 1, PRIORITY_WRITE)
+        rejected = {idx: value for idx, value in values.items() if data.config.unsigned(idx) != value & 0xffff}
+        if rejected:
+            raise ConnectionError(f"Config write not applied: {rejected}")
+        if self.writesAcknowledged is None:
+            # A single missing acknowledgement may just have been lost
+            self.writeAckMisses += 1
+            if self.writeAckMisses >= WRITE_ACK_MAX_MISSES:
+                _LOGGER.debug("Heat pump does not acknowledge writes, verifying them by reading back")
+                self.writesAcknowledged = False
+        self.metrics.write.add(time.monotonic() - started)
+        return data
 
     async def connect(self, server_ip, server_port, serial, password):
         _LOGGER.debug("Connecting to Alsavo Pro")
+        started = time.monotonic()
+        self.invalidate()
 
         self.clientToken = random.randint(0, 65535)
         self.serialQ = serial
         self.password = password
-        self.client = UDPClient(server_ip, server_port)
+        self.seq = 0
+        if self.client is None or self.client.server_host != server_ip or self.client.server_port != server_port:
+            self.close()
+            self.client = UDPClient(server_ip, server_port, PacketHeader.reply_key, self.sharedSocket)
 
         _LOGGER.debug("Asking for auth challenge")
         auth_challenge = await self.get_auth_challenge()
@@ -493,4 +793,7 @@ class AlsavoSocketCom:
         if act != 0x00000005:
             raise ConnectionError("Server returned error in auth, disconnecting")
 
+        self.status = ConnectionStatus.Connected
+        self.lastActivity = time.monotonic()
+        self.metrics.handshake.add(self.lastActivity - started)
         _LOGGER.debug("Connected.")
@@ -1,9 +1,16 @@
 """Alsavo Pro pool heat pump integration."""
+import asyncio
 import logging
-from datetime import timedelta
+import time
+from collections import Counter
+from datetime import datetime
 
 import async_timeout
+from homeassistant.core import callback
+from homeassistant.exceptions import ConfigEntryNotReady, HomeAssistantError
+from homeassistant.helpers.debounce import Debouncer
 from homeassistant.helpers.entity import DeviceInfo
+from homeassistant.helpers.storage import Store
 from homeassistant.helpers.update_coordinator import (
     DataUpdateCoordinator,
 )
@@ -16,9 +23,29 @@ from homeassistant.const import (
 )
 
 from .AlsavoPyCtrl import AlsavoPro
+from .fleet import AlsavoProFleet
 from .const import (
     DOMAIN,
     SERIAL_NO,
+    DEVICE_INFO_REGISTERS,
+    CONFIRM_REFRESH_DELAY,
+    FLEET,
+    POLL_INTERVAL,
+    FLEET_MAX_CONCURRENT_POLLS,
+    POLL_INTERVAL_FAST,
+    POLL_INTERVAL_STABLE,
+    POLL_INTERVAL_OFF,
+    POLL_INTERVAL_MAX,
+    POLL_FAST_PERIOD,
+    POLL_STABLE_POLLS,
+    POLL_GROUP_FAST,
+    COMPRESSOR_FREQUENCY_REGISTER,
+    COMPRESSOR_FREQUENCY_MIN_CHANGE,
+    POWER_CONFIG_REGISTER,
+    STORAGE_VERSION,
+    STORAGE_KEY,
+    STORAGE_SAVE_DELAY,
+    SETUP_TIMEOUT,
 )
 
 _LOGGER = logging.getLogger(__name__)
@@ -37,8 +64,19 @@ async def async_setup_entry(hass, entry):
     password = entry.data.get(CONF_PASSWORD)
 
     data_handler = AlsavoPro(name, serial_no, ip_address, port_no, password)
-    await data_handler.update()
-    data_coordinator = AlsavoProDataCoordinator(hass, data_handler)
+    store = Store(hass, STORAGE_VERSION, STORAGE_KEY.format(entry.entry_id))
+    restored = await _async_restore_snapshot(data_handler, store)
+    if not restored:
+        # Nothing to show until the pump answered once
+        try:
+            async with async_timeout.timeout(SETUP_TIMEOUT):
+                await data_handler.update()
+        except asyncio.TimeoutError:
+            pass
+        if not data_handler.is_online:
+            data_handler.close()
+            raise ConfigEntryNotReady(f"Alsavo Pro {name} at {ip_address} is unreachable")
+    data_coordinator = AlsavoProDataCoordinator(hass, data_handler, store)
 
     if DOMAIN not in hass.data:
         hass.data[DOMAIN] = {}
@@ -46,9 +84,37 @@ async def async_setup_entry(hass, entry):
 
     await hass.config_entries.async_forward_entry_setups(entry, ['binary_sensor', 'sensor', 'climate', 'number'])
 
+    # All entries are polled by one fleet scheduler instead of a timer per coordinator
+    if FLEET not in hass.data[DOMAIN]:
+        hass.data[DOMAIN][FLEET] = AlsavoProFleet(POLL_INTERVAL, FLEET_MAX_CONCURRENT_POLLS,
+                                                  hass.async_create_background_task)
+    # Entities started from a saved snapshot are polled for live data right away, after the setup poll
+    # the next one is due one interval later
+    data_coordinator.join_fleet(hass.data[DOMAIN][FLEET], entry.entry_id,
+                                delay=0 if restored else data_coordinator.poll_interval)
+
     return True
 
 
+async def _async_restore_snapshot(data_handler, store):
+    """Start the handler from the saved snapshot, a missing or unreadable one is ignored."""
+    try:
+        stored = await store.async_load()
+        if stored is None:
+            return False
+        data = bytes.fromhex(stored["data"])
+        last_updated = datetime.fromisoformat(stored["last_updated"])
+    except (HomeAssistantError, KeyError, TypeError, ValueError) as e:
+        _LOGGER.warning(f"Ignoring unreadable saved snapshot: {e}")
+        return False
+    return data_handler.restore(data, last_updated)
+
+
+async def async_remove_entry(hass, entry):
+    """Delete the saved snapshot of a removed entry."""
+    await Store(hass, STORAGE_VERSION, STORAGE_KEY.format(entry.entry_id)).async_remove()
+
+
 async def async_unload_entry(hass, config_entry):
     """Unload a config entry."""
     unload_ok = await hass.config_entries.async_forward_entry_unload(
@@ -63,35 +129,219 @@ async def async_unload_entry(hass, config_entry):
     unload_ok |= await hass.config_entries.async_forward_entry_unload(
         config_entry, "number"
     )
+    if unload_ok:
+        fleet = hass.data[DOMAIN][FLEET]
+        fleet.remove(config_entry.entry_id)
+        if not fleet:
+            hass.data[DOMAIN].pop(FLEET)
+        data_coordinator = hass.data[DOMAIN].pop(config_entry.entry_id)
+        await data_coordinator.async_shutdown()
+        await data_coordinator.async_save_snapshot()
+        data_coordinator.data_handler.close()
     return unload_ok
 
 
 class AlsavoProDataCoordinator(DataUpdateCoordinator):
-    def __init__(self, hass, data_handler):
+    def __init__(self, hass, data_handler, store=None):
         """Initialize my coordinator."""
         super().__init__(
             hass,
             _LOGGER,
             # Name of the data. For logging purposes.
             name="AlsavoPro",
-            # Polling interval. Will only be polled if there are subscribers.
-            update_interval=timedelta(seconds=15),
+            # Polled by the fleet scheduler, see poll_interval
+            update_interval=None,
         )
         self.data_handler = data_handler
+        self._store = store
+        self._save_scheduled = None
+        self._status = None
+        self._config = None
+        self._online = None
+        self.changed_status = frozenset()
+        self.changed_config = frozenset()
+        self.availability_changed = True
+        # Registers always polled, shown in the device info or driving the poll interval
+        self._status_interest = Counter(DEVICE_INFO_REGISTERS + (COMPRESSOR_FREQUENCY_REGISTER,))
+        self._config_interest = Counter((POWER_CONFIG_REGISTER,))
+        self._fleet = None
+        self._fleet_key = None
+        self._last_write = None
+        self._compressor_changing = False
+        self._compressor_frequency = None
+        self._stable_polls = 0
+        self._failed_polls = 0
+        self._confirm_refresh = Debouncer(
+            hass,
+            _LOGGER,
+            cooldown=CONFIRM_REFRESH_DELAY,
+            immediate=False,
+            function=self.async_refresh_config,
+        )
+        data_handler.set_local_change_listener(self.async_publish_changes)
+
+    def join_fleet(self, fleet, key, delay=None):
+        """Have the fleet scheduler poll this heat pump at poll_interval, the first time after delay seconds."""
+        self._fleet, self._fleet_key = fleet, key
+        fleet.add(key, self._async_fleet_refresh, lambda: self.poll_interval, delay)
+
+    async def _async_fleet_refresh(self) -> bool:
+        """Refresh for the fleet scheduler, returns False if the heat pump could not be polled."""
+        # async_refresh doesn't raise, failed polls are caught in _async_update_data
+        await self.async_refresh()
+        return self.data_handler.is_online
+
+    @property
+    def poll_interval(self) -> float:
+        """Seconds between polls of this heat pump, adapted to its state."""
+        if self._failed_polls:
+            return min(POLL_INTERVAL * 2 ** self._failed_polls, POLL_INTERVAL_MAX)
+        if self._is_fast_polling():
+            return POLL_INTERVAL_FAST
+        if not self.data_handler.is_power_on:
+            return POLL_INTERVAL_OFF
+        if self._stable_polls >= POLL_STABLE_POLLS:
+            return POLL_INTERVAL_STABLE
+        return POLL_INTERVAL
+
+    def _is_fast_polling(self) -> bool:
+        recent_write = self._last_write is not None and time.monotonic() - self._last_write < POLL_FAST_PERIOD
+        return recent_write or self._compressor_changing
+
+    def _track_state(self, polled):
+        """Update the state the poll interval is derived from after a poll."""
+        if not polled or not self.data_handler.is_online:
+            self._failed_polls += 1
+            self._stable_polls = 0
+            return
+        self._failed_polls = 0
+        # Measured from the frequency last seen changing, so jitter around it is not a change but a slow drift is
+        frequency = self.data_handler.get_status_value(COMPRESSOR_FREQUENCY_REGISTER)
+        self._compressor_changing = (self._compressor_frequency is not None
+                                     and abs(frequency - self._compressor_frequency) >= COMPRESSOR_FREQUENCY_MIN_CHANGE)
+        if self._compressor_frequency is None or self._compressor_changing:
+            self._compressor_frequency = frequency
+        if self._compressor_changing or self.changed_config is None or self.changed_config:
+            self._stable_polls = 0
+        else:
+            self._stable_polls += 1
+
+    async def async_request_confirmation(self):
+        """Schedule a config re-read confirming recent writes, bursts of writes share one re-read."""
+        self._last_write = time.monotonic()
+        self._stable_polls = 0
+        if self._fleet is not None:
+            self._fleet.reschedule(self._fleet_key)
+        await self._confirm_refresh.async_call()
+
+    async def async_shutdown(self) -> None:
+        """Cancel a pending confirmation re-read."""
+        self._confirm_refresh.async_cancel()
+        await super().async_shutdown()
+
+    def register_interest(self, status_registers, config_registers):
+        """Add registers read by an entity to the ones being polled."""
+        self._status_interest.update(status_registers)
+        self._config_interest.update(config_registers)
+        self.data_handler.set_register_interest(self._status_interest, self._config_interest)
+
+    def unregister_interest(self, status_registers, config_registers):
+        """Stop polling registers that no remaining entity reads."""
+        self._status_interest.subtract(status_registers)
+        self._config_interest.subtract(config_registers)
+        self._status_interest = +self._status_interest
+        self._config_interest = +self._config_interest
+        self.data_handler.set_register_interest(self._status_interest, self._config_interest)
+
+    def _stored_snapshot(self):
+        return {
+            "data": self.data_handler.snapshot().hex(),
+            "last_updated": self.data_handler.last_updated.isoformat(),
+        }
+
+    def _schedule_save(self):
+        """Save the snapshot after the save delay unless a save is already pending."""
+        # Every async_delay_save call restarts the delay, calling it on each poll would never let it fire
+        now = time.monotonic()
+        if self._save_scheduled is None or now - self._save_scheduled >= STORAGE_SAVE_DELAY:
+            self._save_scheduled = now
+            self._store.async_delay_save(self._stored_snapshot, STORAGE_SAVE_DELAY)
+
+    async def async_save_snapshot(self):
+        """Save the last known registers now instead of after the save delay."""
+        if self._store is not None and self.data_handler.last_updated is not None:
+            await self._store.async_save(self._stored_snapshot())
+
+    async def async_refresh_config(self):
+        """Re-read only the config registers and notify entities."""
+        await self.data_handler.refresh_config()
+        self.async_publish_changes()
+
+    @callback
+    def async_publish_changes(self):
+        """Notify entities of registers changed outside a poll, e.g. by an optimistic write."""
+        self._detect_changes()
+        self.async_update_listeners()
+
+    def _detect_changes(self):
+        """Diff the handler's registers against the previous update."""
+        status = self.data_handler.status_registers
+        config = self.data_handler.config_registers
+        online = self.data_handler.is_available
+        self.availability_changed = online != self._online
+        self.changed_status = status.changed(self._status) if self._status is not None else None
+        self.changed_config = config.changed(self._config) if self._config is not None else None
+        self._status, self._config, self._online = status, config, online
+
+    def affects(self, status_registers, config_registers) -> bool:
+        """Return True if the last update touched any of the given registers."""
+        if self.availability_changed or self.changed_status is None or self.changed_config is None:
+            return True
+        return not (self.changed_status.isdisjoint(status_registers)
+                    and self.changed_config.isdisjoint(config_registers))
 
     async def _async_update_data(self):
         _LOGGER.debug("_async_update_data")
+        if self._is_fast_polling():
+            # Telemetry is otherwise only due at its own interval
+            self.data_handler.expire_poll_group(POLL_GROUP_FAST)
+        polled = False
         try:
             async with async_timeout.timeout(10):
                 await self.data_handler.update()
+                polled = True
+                if self._store is not None and self.data_handler.is_online:
+                    self._schedule_save()
                 return self.data_handler
         except Exception as ex:
             _LOGGER.debug("_async_update_data timed out")
+        finally:
+            self._detect_changes()
+            self._track_state(polled)
 
 
 class AlsavoProEntity:
     """Mixin providing device_info for Alsavo Pro entities."""
 
+    # Registers the entity state is derived from, it is only written when one of them changed
+    _status_registers = ()
+    _config_registers = ()
+
+    async def async_added_to_hass(self) -> None:
+        """Poll the registers of this entity while it is enabled."""
+        await super().async_added_to_hass()
+        self.coordinator.register_interest(self._status_registers, self._config_registers)
+
+    async def async_will_remove_from_hass(self) -> None:
+        await super().async_will_remove_from_hass()
+        self.coordinator.unregister_interest(self._status_registers, self._config_registers)
+
+    @callback
+    def _handle_coordinator_update(self) -> None:
+        """Write state only if a register this entity reads has changed."""
+        if self.coordinator.affects(self._status_registers, self._config_registers):
+            super()._handle_coordinator_update()
+
     @property
     def device_info(self) -> DeviceInfo:
         """Return device information."""
@@ -3,6 +3,7 @@ from homeassistant.components.binary_sensor import (
     BinarySensorEntity,
 )
 from homeassistant.const import EntityCategory
+from homeassistant.core import callback
 
 from . import AlsavoProDataCoordinator, AlsavoProEntity
 from .const import DOMAIN
@@ -28,6 +29,7 @@ class AlsavoProConnectivitySensor(AlsavoProEntity, CoordinatorEntity, BinarySens
         super().__init__(coordinator)
         self.data_coordinator = coordinator
         self._data_handler = self.data_coordinator.data_handler
+        self._restored = self._data_handler.is_restored
 
     @property
     def name(self):
@@ -44,10 +46,32 @@ class AlsavoProConnectivitySensor(AlsavoProEntity, CoordinatorEntity, BinarySens
         """Return True if the heat pump is connected."""
         return self._data_handler.is_online
 
+    @property
+    def extra_state_attributes(self):
+        """Return when the shown values were read while they are restored from the last run."""
+        if not self._data_handler.is_restored:
+            return None
+        last_updated = self._data_handler.last_updated
+        return {
+            "last_updated": last_updated.isoformat() if last_updated is not None else None,
+            "restored": True,
+        }
+
+    @callback
+    def _handle_coordinator_update(self) -> None:
+        """Write state when connectivity changes, or live data replaced the restored values."""
+        restored = self._data_handler.is_restored
+        if restored != self._restored:
+            self._restored = restored
+            self.async_write_ha_state()
+        else:
+            super()._handle_coordinator_update()
+
 
 class AlsavoProFrostProtectionSensor(AlsavoProEntity, CoordinatorEntity, BinarySensorEntity):
     _attr_has_entity_name = True
     _attr_device_class = BinarySensorDeviceClass.COLD
+    _status_registers = (49,)
 
     def __init__(self, coordinator: AlsavoProDataCoordinator):
         super().__init__(coordinator)
@@ -74,6 +98,7 @@ class AlsavoProAlarmSensor(AlsavoProEntity, CoordinatorEntity, BinarySensorEntit
     _attr_has_entity_name = True
     _attr_device_class = BinarySensorDeviceClass.PROBLEM
     _attr_entity_category = EntityCategory.DIAGNOSTIC
+    _status_registers = (48, 49)
 
     def __init__(self, coordinator: AlsavoProDataCoordinator):
         super().__init__(coordinator)
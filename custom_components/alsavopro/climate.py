@@ -40,6 +40,8 @@ async def async_setup_entry(hass, entry, async_add_entities):
 class AlsavoProClimate(AlsavoProEntity, CoordinatorEntity, ClimateEntity):
     """ Climate platform for Alsavo Pro pool heater """
     _attr_has_entity_name = True
+    _status_registers = (16, 55, 56)
+    _config_registers = (1, 2, 3, 4, 16)
 
     def __init__(self, coordinator: AlsavoProDataCoordinator):
         """Initialize the heater."""
@@ -66,7 +68,7 @@ class AlsavoProClimate(AlsavoProEntity, CoordinatorEntity, ClimateEntity):
     @property
     def available(self) -> bool:
         """Return True if roller and hub is available."""
-        return self._data_handler.is_online
+        return self._data_handler.is_available
 
     @property
     def hvac_mode(self):
@@ -120,7 +122,7 @@ class AlsavoProClimate(AlsavoProEntity, CoordinatorEntity, ClimateEntity):
         action = hvac_mode_actions.get(hvac_mode)
         if action:
             await action()
-            await self.coordinator.async_request_refresh()
+            await self.coordinator.async_request_confirmation()
 
     async def async_set_preset_mode(self, preset_mode):
         """Set hvac preset mode."""
@@ -133,7 +135,7 @@ class AlsavoProClimate(AlsavoProEntity, CoordinatorEntity, ClimateEntity):
         power_mode = preset_mode_to_power_mode.get(preset_mode)
         if power_mode is not None:
             await self._data_handler.set_power_mode(power_mode)
-            await self.coordinator.async_request_refresh()
+            await self.coordinator.async_request_confirmation()
 
     @property
     def temperature_unit(self):
@@ -171,7 +173,7 @@ class AlsavoProClimate(AlsavoProEntity, CoordinatorEntity, ClimateEntity):
         if temperature is None:
             return
         await self._data_handler.set_target_temperature(temperature)
-        await self.coordinator.async_request_refresh()
+        await self.coordinator.async_request_confirmation()
 
     async def async_update(self):
         """Get the latest data."""
@@ -0,0 +1,258 @@
+"""Wire format of the Alsavo Pro UDP protocol."""
+import struct
+from datetime import datetime, timezone
+
+HDR_REQUEST = 0x32
+HDR_REPLY = 0x30
+CMD_AUTH = 0xf2
+CMD_DATA = 0xf4
+
+HEADER = struct.Struct('!BBHIIHH')
+_REPLY_KEY = struct.Struct('!2xHI')
+_TIMESTAMP = struct.Struct('!HBBBBBB')
+_AUTH_INTRO = struct.Struct('!BBBBIQIIII')
+_AUTH_CHALLENGE = struct.Struct('!BBBBI')
+_AUTH_RESPONSE = struct.Struct('!BBBB16s')
+_SET_CONFIG = struct.Struct('!BBHIHH')
+_CONFIG_PAIR = struct.Struct('!HH')
+_QUERY_HEADER = struct.Struct('!BBH')
+_QUERY_WINDOW = struct.Struct('!IHHHH')
+_QUERY_KIND = struct.Struct('!IH')
+_PAYLOAD_HEADER = struct.Struct('!IHH')
+_REGISTER_WINDOW = struct.Struct('!HH')
+_PAYLOAD_TYPE = 0x0002002e
+
+# Register kinds, the payload sub types of status and config
+KIND_STATUS = 0x0001
+KIND_CONFIG = 0x0002
+KIND_ALL = 0xffff
+
+# Constant request payloads
+QUERY_ALL = b'\x08\x01\x00\x00\x00\x02\x00\x2e\xff\xff\x00\x00'
+
+_UUID = (0x97e8ced0, 0xf83640bc, 0xb4dd57e3, 0x22adc3a0)
+
+
+def encode_packet(seq, csid, dsid, cmd, payload):
+    """ Header and payload packed into a single preallocated buffer """
+    buffer = bytearray(HEADER.size + payload.__len__())
+    HEADER.pack_into(buffer, 0, HDR_REQUEST, 0, seq, csid, dsid, cmd, payload.__len__())
+    buffer[HEADER.size:] = payload
+    return buffer
+
+
+def encode_set_config(idx, value):
+    """ Payload writing value to config register idx """
+    return encode_set_configs({idx: value})
+
+
+def encode_set_configs(values):
+    """ Payload writing several config registers at once, values maps register index to value """
+    buffer = bytearray(_SET_CONFIG.size + _CONFIG_PAIR.size * values.__len__())
+    _SET_CONFIG.pack_into(buffer, 0, 0x09, 0x01, 0, 0x0002002e, KIND_CONFIG, _CONFIG_PAIR.size * values.__len__())
+    offset = _SET_CONFIG.size
+    for idx, value in values.items():
+        _CONFIG_PAIR.pack_into(buffer, offset, idx & 0xffff, value & 0xffff)
+        offset += _CONFIG_PAIR.size
+    return bytes(buffer)
+
+
+def encode_query(windows):
+    """ Query payload asking for the given (kind, start_idx, count) register windows """
+    buffer = bytearray(_QUERY_HEADER.size + _QUERY_WINDOW.size * windows.__len__())
+    _QUERY_HEADER.pack_into(buffer, 0, 0x08, windows.__len__(), 0)
+    offset = _QUERY_HEADER.size
+    for kind, start_idx, count in windows:
+        _QUERY_WINDOW.pack_into(buffer, offset, 0x0002002e, kind, 4, start_idx, count)
+        offset += _QUERY_WINDOW.size
+    return bytes(buffer)
+
+
+def encode_query_response(action, parts):
+    """ Query response payload, parts is a list of (sub_type, start_idx, big-endian register bytes) """
+    """ Status (1) and config (2) parts carry their start index and register count, device info (3) doesn't. """
+    buffer = bytearray(_QUERY_HEADER.pack(action, parts.__len__(), 0))
+    for sub_type, start_idx, values in parts:
+        if sub_type == KIND_STATUS or sub_type == KIND_CONFIG:
+            buffer += _PAYLOAD_HEADER.pack(_PAYLOAD_TYPE, sub_type, _REGISTER_WINDOW.size + values.__len__())
+            buffer += _REGISTER_WINDOW.pack(start_idx, values.__len__() // 2)
+        else:
+            buffer += _PAYLOAD_HEADER.pack(_PAYLOAD_TYPE, sub_type, values.__len__())
+        buffer += values
+    return bytes(buffer)
+
+
+def decode_query(payload):
+    """ (kind, start_idx, count) windows of a query payload, the inverse of encode_query """
+    """ QUERY_ALL decodes to the single window (KIND_ALL, 0, 0). """
+    _, parts, _ = _QUERY_HEADER.unpack_from(payload)
+    windows = []
+    offset = _QUERY_HEADER.size
+    for _ in range(parts):
+        if offset + _QUERY_WINDOW.size > payload.__len__():
+            # Asking for all registers leaves out start index and count
+            windows.append((_QUERY_KIND.unpack_from(payload, offset)[1], 0, 0))
+            break
+        _, kind, _, start_idx, count = _QUERY_WINDOW.unpack_from(payload, offset)
+        windows.append((kind, start_idx, count))
+        offset += _QUERY_WINDOW.size
+    return windows
+
+
+def decode_set_configs(payload):
+    """ Register index to value of a set config payload, the inverse of encode_set_configs """
+    *_, size = _SET_CONFIG.unpack_from(payload)
+    values = {}
+    for offset in range(_SET_CONFIG.size, _SET_CONFIG.size + size, _CONFIG_PAIR.size):
+        idx, value = _CONFIG_PAIR.unpack_from(payload, offset)
+        values[idx] = value
+    return values
+
+
+class PacketHeader:
+    """ This is the packet header """
+    """ It consists of 16 bytes and have the following attributes: """
+    """ - hdr - byte - 0x32 = request, 0x30 = response """
+    """ - pad - byte - Padding. Always 0 """
+    """ - seq - Int16 - Sequence number (monotonically increasing once session has been set up, otherwise 0) """
+    """ - csid - Int32 - ??? """
+    """ - dsid - Int32 - ??? """
+    """ - cmd - Int16 - Command """
+    """ - Payload length - Int16 - """
+    __slots__ = ('hdr', 'pad', 'seq', 'csid', 'dsid', 'cmd', 'payloadLength')
+
+    def __init__(self, hdr, seq, csid, dsid, cmd, payload_length):
+        self.hdr = hdr
+        self.pad = 0
+        self.seq = seq
+        self.csid = csid
+        self.dsid = dsid
+        self.cmd = cmd
+        self.payloadLength = payload_length
+
+    @property
+    def is_reply(self):
+        return (self.hdr & 2) == 0
+
+    def pack(self):
+        return HEADER.pack(self.hdr, self.pad, self.seq, self.csid, self.dsid, self.cmd, self.payloadLength)
+
+    def pack_into(self, buffer, offset=0):
+        HEADER.pack_into(buffer, offset, self.hdr, self.pad, self.seq, self.csid, self.dsid, self.cmd,
+                         self.payloadLength)
+
+    @staticmethod
+    def reply_key(data):
+        """ (csid, seq) of a received packet, used to match it with the request it answers """
+        seq, csid = _REPLY_KEY.unpack_from(data)
+        return csid, seq
+
+    @staticmethod
+    def unpack(data, offset=0):
+        hdr, _, seq, csid, dsid, cmd, payload_length = HEADER.unpack_from(data, offset)
+        return PacketHeader(hdr, seq, csid, dsid, cmd, payload_length)
+
+
+class Timestamp:
+    __slots__ = ('year', 'month', 'day', 'hour', 'min', 'sec', 'tz')
+
+    def __init__(self):
+        current_time = datetime.now(timezone.utc)
+        self.year = current_time.year
+        self.month = current_time.month
+        self.day = current_time.day
+        self.hour = current_time.hour
+        self.min = current_time.minute
+        self.sec = current_time.second
+        self.tz = 2  # Placeholder
+
+    def pack(self):
+        return _TIMESTAMP.pack(self.year, self.month, self.day, self.hour, self.min, self.sec, self.tz)
+
+    def pack_into(self, buffer, offset):
+        _TIMESTAMP.pack_into(buffer, offset, self.year, self.month, self.day, self.hour, self.min, self.sec,
+                             self.tz)
+
+
+class AuthIntro:
+    __slots__ = ('hdr', 'act1', 'act2', 'act3', 'act4', 'clientToken', 'pumpSerial', 'timestamp')
+
+    def __init__(self, client_token, serial_inv):
+        self.hdr = PacketHeader(HDR_REQUEST, 0, 0, 0, CMD_AUTH, _AUTH_INTRO.size + _TIMESTAMP.size)
+        self.act1, self.act2, self.act3, self.act4 = 1, 1, 2, 0
+        self.clientToken = client_token
+        self.pumpSerial = serial_inv
+        self.timestamp = Timestamp()
+
+    def pack(self):
+        buffer = bytearray(HEADER.size + _AUTH_INTRO.size + _TIMESTAMP.size)
+        self.hdr.pack_into(buffer)
+        _AUTH_INTRO.pack_into(buffer, HEADER.size, self.act1, self.act2, self.act3, self.act4, self.clientToken,
+                              self.pumpSerial, *_UUID)
+        self.timestamp.pack_into(buffer, HEADER.size + _AUTH_INTRO.size)
+        return buffer
+
+    @staticmethod
+    def unpack(data):
+        packet_hdr = PacketHeader.unpack(data)
+        act1, act2, act3, act4, client_token, serial_inv, *_ = _AUTH_INTRO.unpack_from(data, HEADER.size)
+        obj = AuthIntro(client_token, serial_inv)
+        obj.hdr = packet_hdr
+        obj.act1, obj.act2, obj.act3, obj.act4 = act1, act2, act3, act4
+        return obj
+
+
+class AuthChallenge:
+    __slots__ = ('hdr', 'act1', 'act2', 'act3', 'act4', 'serverToken')
+
+    def __init__(self, hdr, act1, act2, act3, act4, server_token):
+        self.hdr = hdr
+        self.act1 = act1
+        self.act2 = act2
+        self.act3 = act3
+        self.act4 = act4
+        self.serverToken = server_token
+
+    def pack(self):
+        buffer = bytearray(HEADER.size + _AUTH_CHALLENGE.size)
+        self.hdr.pack_into(buffer)
+        _AUTH_CHALLENGE.pack_into(buffer, HEADER.size, self.act1, self.act2, self.act3, self.act4, self.serverToken)
+        return buffer
+
+    @staticmethod
+    def unpack(data):
+        # 16 first bytes are header
+        packet_hdr = PacketHeader.unpack(data)
+        return AuthChallenge(packet_hdr, *_AUTH_CHALLENGE.unpack_from(data, HEADER.size))
+
+    @property
+    def is_authorized(self):
+        return self.act1 == 3 and self.act2 == 0 and self.act3 == 0 and self.act4 == 0
+
+
+class AuthResponse:
+    __slots__ = ('hdr', 'act1', 'act2', 'act3', 'act4', 'timestamp', 'response')
+
+    def __init__(self, csid, dsid, resp):
+        self.hdr = PacketHeader(HDR_REQUEST, 0, csid, dsid, CMD_AUTH, _AUTH_RESPONSE.size + _TIMESTAMP.size)
+        self.act1, self.act2, self.act3, self.act4 = 4, 0, 0, 3
+        self.timestamp = Timestamp()
+
+        # Response field (as a bytes object)
+        self.response = bytes(resp)
+
+    def pack(self):
+        buffer = bytearray(HEADER.size + _AUTH_RESPONSE.size + _TIMESTAMP.size)
+        self.hdr.pack_into(buffer)
+        _AUTH_RESPONSE.pack_into(buffer, HEADER.size, self.act1, self.act2, self.act3, self.act4, self.response)
+        self.timestamp.pack_into(buffer, HEADER.size + _AUTH_RESPONSE.size)
+        return buffer
+
+    @staticmethod
+    def unpack(data):
+        packet_hdr = PacketHeader.unpack(data)
+        act1, act2, act3, act4, resp = _AUTH_RESPONSE.unpack_from(data, HEADER.size)
+        obj = AuthResponse(packet_hdr.csid, packet_hdr.dsid, resp)
+        obj.hdr = packet_hdr
+        obj.act1, obj.act2, obj.act3, obj.act4 = act1, act2, act3, act4
+        return obj
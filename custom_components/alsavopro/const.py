@@ -24,6 +24,63 @@ MODE_TO_CONFIG = {0: 2,  # Cool
 NO_WATER_FLUX = "No water flux or water flow switch failure.\n\r"
 WATER_TEMP_TOO_LOW = "Water temperature (T2) too low protection under cooling mode.\n\r"
 
-# Max retries
-MAX_UPDATE_RETRIES = 10
-MAX_SET_CONFIG_RETRIES = 10
+# Retries, attempts per operation and backoff bounds in seconds
+RETRY_ATTEMPTS = 3
+RETRY_BASE_DELAY = 0.5
+RETRY_MAX_DELAY = 2.0
+
+# Circuit breaker, opens after this many failed operations in a row and probes again after the timeout
+BREAKER_FAILURE_THRESHOLD = 3
+BREAKER_RESET_TIMEOUT = 60
+BREAKER_MAX_RESET_TIMEOUT = 900
+
+# Re-authenticate when the session has been idle for this many seconds
+SESSION_MAX_IDLE = 120
+
+# Register groups polled at their own cadence, (kind, start index, count) windows with kind 1 = status, 2 = config
+POLL_GROUP_FAST = "telemetry"  # Temperatures, fan, valve and compressor
+POLL_GROUP_SLOW = "state"  # Frequency limit, alarm and system codes
+POLL_GROUP_CONFIG = "config"  # Mode, setpoints, power mode and calibration
+POLL_GROUP_IDENTITY = "identity"  # Setpoint limits, device type and revisions
+POLL_GROUPS = {
+    POLL_GROUP_FAST: (15, ((1, 16, 12),)),
+    POLL_GROUP_SLOW: (60, ((1, 34, 21),)),
+    POLL_GROUP_CONFIG: (60, ((2, 0, 17),)),
+    POLL_GROUP_IDENTITY: (None, ((1, 55, 2), (1, 64, 5))),
+}
+# Windowed queries failing this many times in a row while full queries succeed are given up on
+WINDOWED_QUERY_MAX_FAILURES = 3
+# Writes applied without an acknowledgement this many times in a row mark the pump as not acknowledging writes
+WRITE_ACK_MAX_MISSES = 3
+
+# Status registers always polled as they are shown in the device info (HW and SW revision)
+DEVICE_INFO_REGISTERS = (65, 66)
+
+# Seconds after the last write before the config registers are re-read to confirm it
+CONFIRM_REFRESH_DELAY = 5
+
+# Polling of all heat pumps, interval in seconds and how many may be polled at the same time
+FLEET = "fleet"
+POLL_INTERVAL = 15
+FLEET_MAX_CONCURRENT_POLLS = 8
+
+# Adaptive poll interval in seconds: fast after a write or while the compressor frequency changes, slow once
+# nothing changed for POLL_STABLE_POLLS polls or while powered off, and doubling up to the max after errors
+POLL_INTERVAL_FAST = 5
+POLL_INTERVAL_STABLE = 60
+POLL_INTERVAL_OFF = 300
+POLL_INTERVAL_MAX = 300
+POLL_FAST_PERIOD = 60
+POLL_STABLE_POLLS = 4
+COMPRESSOR_FREQUENCY_REGISTER = 27
+# Hz the compressor frequency must move from where it settled to count as changing, inverters jitter by less
+COMPRESSOR_FREQUENCY_MIN_CHANGE = 3
+POWER_CONFIG_REGISTER = 4
+
+# Last known registers saved across restarts, written at most once per delay in seconds
+STORAGE_VERSION = 1
+STORAGE_KEY = "alsavopro.{}"
+STORAGE_SAVE_DELAY = 300
+
+# Seconds the first poll may take when there is no saved snapshot to start from
+SETUP_TIMEOUT = 10
@@ -0,0 +1,139 @@
+"""Fleet-wide polling of many heat pumps."""
+import asyncio
+import logging
+import time
+
+from .metrics import percentile
+
+_LOGGER = logging.getLogger(__name__)
+
+# Fractional part of the golden ratio, spreads phases evenly however many members join
+_PHASE_STEP = 0.6180339887498949
+
+
+def _create_task(coro, name):
+    return asyncio.get_running_loop().create_task(coro, name=name)
+
+
+class FleetCycle:
+    """ Polls completed during one fleet interval """
+    __slots__ = ('started', 'polls', 'failures', 'latency_p50', 'latency_p95', 'latency_max', 'wait_max')
+
+    def __init__(self, started, latencies, waits, failures):
+        self.started = started
+        self.polls = len(latencies)
+        self.failures = failures
+        self.latency_p50 = percentile(latencies, 50)
+        self.latency_p95 = percentile(latencies, 95)
+        self.latency_max = max(latencies, default=None)
+        self.wait_max = max(waits, default=None)
+
+    def __repr__(self):
+        return (f"FleetCycle(polls={self.polls}, failures={self.failures}, p50={self.latency_p50}, "
+                f"p95={self.latency_p95}, max={self.latency_max}, wait_max={self.wait_max})")
+
+
+class _Member:
+    __slots__ = ('refresh', 'interval', 'delay', 'task', 'wakeup')
+
+    def __init__(self, refresh, interval, delay):
+        self.refresh = refresh
+        self.interval = interval
+        self.delay = delay
+        self.task = None
+        self.wakeup = asyncio.Event()
+
+
+class AlsavoProFleet:
+    """ Polls all heat pumps with bounded concurrency and staggered phases """
+    """ Each member is a refresh coroutine function plus a callable giving its poll interval in seconds. """
+    """ A refresh returning False or raising counts as a failed poll. """
+    """ Members poll at a fixed rate from their own phase offset within the interval, at most """
+    """ max_concurrency at a time. Polls are summarised per fleet interval in last_cycle. Tasks are started """
+    """ with create_task(coro, name) if given, e.g. so that Home Assistant tracks and cancels them on stop. """
+
+    def __init__(self, interval, max_concurrency, create_task=None):
+        self.interval = interval
+        self._create_task = create_task or _create_task
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._members = {}
+        self._joined = 0
+        self._latencies = []
+        self._waits = []
+        self._failures = 0
+        self._cycle_started = time.monotonic()
+        self._report_task = None
+        self.last_cycle = None
+
+    def __len__(self):
+        return self._members.__len__()
+
+    def add(self, key, refresh, interval=None, delay=None):
+        """ Start polling a member, interval defaults to the fleet interval """
+        """ The first poll is delay seconds from now, by default the member's phase within the interval. """
+        self.remove(key)
+        if delay is None:
+            delay = (self._joined * _PHASE_STEP) % 1.0 * self.interval
+        self._joined += 1
+        member = _Member(refresh, interval or (lambda: self.interval), delay)
+        member.task = self._create_task(self._poll_member(key, member), f"alsavopro poll {key}")
+        self._members[key] = member
+        if self._report_task is None:
+            self._cycle_started = time.monotonic()
+            self._report_task = self._create_task(self._report(), "alsavopro fleet report")
+
+    def remove(self, key):
+        member = self._members.pop(key, None)
+        if member is not None:
+            member.task.cancel()
+        if not self._members and self._report_task is not None:
+            self._report_task.cancel()
+            self._report_task = None
+
+    def reschedule(self, key):
+        """ Re-read the interval of a waiting member, e.g. when it got shorter """
+        member = self._members.get(key)
+        if member is not None:
+            member.wakeup.set()
+
+    def stop(self):
+        for key in list(self._members):
+            self.remove(key)
+
+    async def _poll_member(self, key, member):
+        await asyncio.sleep(member.delay)
+        while True:
+            scheduled = time.monotonic()
+            async with self._semaphore:
+                started = time.monotonic()
+                try:
+                    if await member.refresh() is False:
+                        self._failures += 1
+                except Exception as e:
+                    _LOGGER.error(f"Polling {key} failed: {e}")
+                    self._failures += 1
+                self._latencies.append(time.monotonic() - started)
+                self._waits.append(started - scheduled)
+            await self._wait(member, scheduled)
+
+    @staticmethod
+    async def _wait(member, scheduled):
+        """ Sleep until one interval after scheduled, the interval is re-read when the member is rescheduled """
+        member.wakeup.clear()
+        while True:
+            delay = scheduled + member.interval() - time.monotonic()
+            if delay <= 0:
+                return
+            try:
+                await asyncio.wait_for(member.wakeup.wait(), delay)
+            except asyncio.TimeoutError:
+                return
+            member.wakeup.clear()
+
+    async def _report(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            self.last_cycle = FleetCycle(self._cycle_started, self._latencies, self._waits, self._failures)
+            self._cycle_started = time.monotonic()
+            self._latencies, self._waits, self._failures = [], [], 0
+            _LOGGER.debug(f"Fleet of {self._members.__len__()}: {self.last_cycle}")
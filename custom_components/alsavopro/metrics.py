@@ -0,0 +1,57 @@
+"""Per device latency and reliability metrics."""
+import math
+from collections import deque
+
+# Samples kept per histogram, percentiles describe the most recent ones
+ROLLING_SAMPLES = 100
+
+
+def percentile(values, q):
+    """ q-th percentile (0-100) of values using the nearest rank, None for no values """
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, math.ceil(q / 100 * len(ordered)) - 1))]
+
+
+class RollingHistogram:
+    """ The last samples of a measurement in seconds """
+
+    def __init__(self, size=ROLLING_SAMPLES):
+        self._samples = deque(maxlen=size)
+        self.count = 0
+
+    def __len__(self):
+        return self._samples.__len__()
+
+    def add(self, value):
+        self._samples.append(value)
+        self.count += 1
+
+    def percentile(self, q):
+        return percentile(self._samples, q)
+
+
+class DeviceMetrics:
+    """ Timings of the phases of talking to one heat pump, and how often it went wrong """
+    """ handshake, query, write and parse are histograms of seconds, query only of round trips answered on the """
+    """ first transmission. retries counts operations attempted again and the outcomes of the last polls give """
+    """ the success ratio. """
+
+    def __init__(self, size=ROLLING_SAMPLES):
+        self.handshake = RollingHistogram(size)
+        self.query = RollingHistogram(size)
+        self.write = RollingHistogram(size)
+        self.parse = RollingHistogram(size)
+        self.retries = 0
+        self._polls = deque(maxlen=size)
+
+    def record_poll(self, success):
+        self._polls.append(success)
+
+    @property
+    def success_ratio(self):
+        """ Share of the last polls that succeeded, None before the first poll """
+        if not self._polls:
+            return None
+        return sum(self._polls) / self._polls.__len__()
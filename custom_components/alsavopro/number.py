@@ -48,6 +48,7 @@ class AlsavoProNumber(AlsavoProEntity, CoordinatorEntity, NumberEntity):
         self._name = name
         self._attr_native_unit_of_measurement = unit
         self._dataIdx = idx
+        self._config_registers = (idx,)
         self._icon = icon
         self._attr_native_min_value = min_value
         self._attr_native_max_value = max_value
@@ -64,7 +65,7 @@ class AlsavoProNumber(AlsavoProEntity, CoordinatorEntity, NumberEntity):
     @property
     def available(self) -> bool:
         """Return True if device is available."""
-        return self._data_handler.is_online
+        return self._data_handler.is_available
 
     @property
     def unique_id(self):
@@ -83,4 +84,4 @@ class AlsavoProNumber(AlsavoProEntity, CoordinatorEntity, NumberEntity):
     async def async_set_native_value(self, value: float) -> None:
         """Set new value."""
         await self._data_handler.set_config(self._dataIdx, int(value * 10))
-        await self.coordinator.async_request_refresh()
+        await self.coordinator.async_request_confirmation()
@@ -0,0 +1,93 @@
+"""Adaptive request-rate control for endpoints shared by many heat pumps."""
+import asyncio
+import time
+from collections import deque
+
+# Request priorities, lower is served first
+PRIORITY_WRITE = 0
+PRIORITY_POLL = 1
+
+# Bounds of the congestion window, the number of requests allowed in flight
+WINDOW_INITIAL = 4.0
+WINDOW_MIN = 1.0
+WINDOW_MAX = 32.0
+# Multiplicative decrease on congestion
+WINDOW_DECREASE = 0.5
+# Round trip times above this multiple of the smallest one seen from the same device count as congestion
+RTT_TOLERANCE = 3.0
+
+
+class AimdRateController:
+    """ Additive-increase/multiplicative-decrease limit on requests in flight """
+    """ Every answered request grows the window by 1/window, about one request per window of replies. """
+    """ A timeout or a round trip time far above the base RTT of the device it went to halves it, at most once """
+    """ per round trip so a burst of losses counts as one congestion event. Devices behind the endpoint can """
+    """ have very different paths, so each reply is compared with the smallest RTT of its own device. Waiting """
+    """ requests are served by priority, then in arrival order. """
+
+    def __init__(self, window=WINDOW_INITIAL, min_window=WINDOW_MIN, max_window=WINDOW_MAX,
+                 decrease=WINDOW_DECREASE, rtt_tolerance=RTT_TOLERANCE):
+        self.window = window
+        self.min_window = min_window
+        self.max_window = max_window
+        self.decrease = decrease
+        self.rtt_tolerance = rtt_tolerance
+        self.in_flight = 0
+        self.srtt = None
+        self._last_decrease = None
+        self._waiters = (deque(), deque())
+
+    @property
+    def queued(self):
+        return sum(waiters.__len__() for waiters in self._waiters)
+
+    async def acquire(self, priority=PRIORITY_POLL):
+        """ Wait for a slot in the window """
+        if self.in_flight < self.window and not self.queued:
+            self.in_flight += 1
+            return
+        future = asyncio.get_running_loop().create_future()
+        self._waiters[priority].append(future)
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # The slot was handed over just before the cancellation, pass it on
+                self.release()
+            else:
+                self._waiters[priority].remove(future)
+            raise
+
+    def release(self):
+        self.in_flight -= 1
+        self._wake()
+
+    def _wake(self):
+        for waiters in self._waiters:
+            while waiters and self.in_flight < self.window:
+                future = waiters.popleft()
+                if not future.done():
+                    self.in_flight += 1
+                    future.set_result(None)
+            if waiters:
+                return
+
+    def on_reply(self, rtt, base_rtt):
+        """ Feed the round trip time of an answered request and the smallest one seen from its device """
+        self.srtt = rtt if self.srtt is None else 0.875 * self.srtt + 0.125 * rtt
+        if rtt > base_rtt * self.rtt_tolerance:
+            self._congested()
+        else:
+            self.window = min(self.window + 1 / self.window, self.max_window)
+            self._wake()
+
+    def on_timeout(self):
+        """ A request went unanswered """
+        self._congested()
+
+    def _congested(self):
+        now = time.monotonic()
+        if self._last_decrease is not None and now - self._last_decrease < (self.srtt or 0):
+            return
+        self._last_decrease = now
+        self.window = max(self.window * self.decrease, self.min_window)
@@ -0,0 +1,117 @@
+"""Register snapshots decoded from heat pump payloads."""
+import sys
+from array import array
+
+_SWAP = sys.byteorder == 'little'
+
+
+class RegisterSnapshot:
+    """ Immutable block of consecutive 16 bit registers starting at index start """
+    """ Values are kept unsigned in an array('H'); indices outside the block read as 0. """
+    __slots__ = ('start', '_values', '_hash')
+
+    def __init__(self, start, values):
+        object.__setattr__(self, 'start', start)
+        object.__setattr__(self, '_values', values)
+        object.__setattr__(self, '_hash', None)
+
+    @staticmethod
+    def from_buffer(start, buffer):
+        """ Decode big-endian registers from a bytes-like object or memoryview """
+        values = array('H')
+        values.frombytes(buffer)
+        if _SWAP:
+            values.byteswap()
+        return RegisterSnapshot(start, values)
+
+    @staticmethod
+    def from_values(start, values):
+        return RegisterSnapshot(start, array('H', values))
+
+    def __setattr__(self, name, value):
+        raise AttributeError("RegisterSnapshot is immutable")
+
+    def __len__(self):
+        return self._values.__len__()
+
+    def __eq__(self, other):
+        if not isinstance(other, RegisterSnapshot):
+            return NotImplemented
+        return self.start == other.start and self._values == other._values
+
+    def __hash__(self):
+        if self._hash is None:
+            object.__setattr__(self, '_hash', hash((self.start, self._values.tobytes())))
+        return self._hash
+
+    def __repr__(self):
+        return f"RegisterSnapshot(start={self.start}, count={self._values.__len__()})"
+
+    @property
+    def end(self):
+        """ Index after the last register """
+        return self.start + self._values.__len__()
+
+    def to_bytes(self):
+        """ Big-endian wire representation of the registers """
+        values = array('H', self._values)
+        if _SWAP:
+            values.byteswap()
+        return values.tobytes()
+
+    def covers(self, start, count):
+        """ True if the block holds the count registers from start """
+        return bool(self._values) and self.start <= start and start + count <= self.end
+
+    def merge(self, other):
+        """ Snapshot covering both blocks, where the values of other take precedence """
+        if not other._values:
+            return self
+        if not self._values or (other.start <= self.start and other.end >= self.end):
+            return other
+        start = min(self.start, other.start)
+        values = array('H', [0]) * (max(self.end, other.end) - start)
+        values[self.start - start:self.end - start] = self._values
+        values[other.start - start:other.end - start] = other._values
+        return RegisterSnapshot(start, values)
+
+    def with_values(self, values):
+        """ Copy with the registers in values (index to value) replaced, growing the block if needed """
+        if not values:
+            return self
+        start = min(values)
+        end = max(values) + 1
+        if self._values:
+            start = min(start, self.start)
+            end = max(end, self.end)
+        new_values = array('H', [0]) * (end - start)
+        new_values[self.start - start:self.end - start] = self._values
+        for idx, value in values.items():
+            new_values[idx - start] = value & 0xffff
+        return RegisterSnapshot(start, new_values)
+
+    def changed(self, other):
+        """ Indices whose value differs from the other snapshot """
+        if self == other:
+            return frozenset()
+        if self.start == other.start and self._values.__len__() == other._values.__len__():
+            return frozenset(self.start + i for i, (a, b) in enumerate(zip(self._values, other._values)) if a != b)
+        return frozenset(i for i in range(min(self.start, other.start), max(self.end, other.end))
+                         if self.unsigned(i) != other.unsigned(i))
+
+    def unsigned(self, idx):
+        i = idx - self.start
+        if 0 <= i < self._values.__len__():
+            return self._values[i]
+        return 0
+
+    def signed(self, idx):
+        value = self.unsigned(idx)
+        return value - 0x10000 if value & 0x8000 else value
+
+    def temperature(self, idx):
+        """ Register holding a signed temperature in tenths of a degree """
+        return self.signed(idx) / 10
+
+
+EMPTY = RegisterSnapshot.from_values(0, ())
@@ -0,0 +1,71 @@
+"""Retry policy and circuit breaker for talking to the heat pump."""
+import random
+import time
+from enum import Enum
+
+
+class RetryPolicy:
+    """ Bounded retries with exponential backoff and full jitter """
+
+    def __init__(self, attempts, base_delay, max_delay):
+        self.attempts = attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def delay(self, attempt):
+        """ Seconds to wait before retry number attempt + 1 """
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+
+class BreakerState(Enum):
+    Closed = 0
+    Open = 1
+    HalfOpen = 2
+
+
+class CircuitOpenError(ConnectionError):
+    """ Raised when the circuit breaker refuses an operation """
+
+
+class CircuitBreaker:
+    """ Stops hammering an unreachable pump """
+    """ After failure_threshold failed operations in a row the breaker opens and operations are refused. """
+    """ Once reset_timeout has passed a single probe is let through (half-open); its outcome closes the """
+    """ breaker again or re-opens it with a doubled timeout, up to max_reset_timeout. """
+
+    def __init__(self, failure_threshold, reset_timeout, max_reset_timeout):
+        self.failure_threshold = failure_threshold
+        self.base_reset_timeout = reset_timeout
+        self.max_reset_timeout = max_reset_timeout
+        self.reset_timeout = reset_timeout
+        self.state = BreakerState.Closed
+        self.failures = 0
+        self.opened_at = None
+
+    @property
+    def is_closed(self):
+        return self.state == BreakerState.Closed
+
+    def allow_request(self):
+        """ True if an operation may be attempted now """
+        if self.state == BreakerState.Open and time.monotonic() - self.opened_at >= self.reset_timeout:
+            self.state = BreakerState.HalfOpen
+            return True
+        return self.state == BreakerState.Closed
+
+    def record_success(self):
+        self.state = BreakerState.Closed
+        self.failures = 0
+        self.reset_timeout = self.base_reset_timeout
+
+    def record_failure(self):
+        self.failures += 1
+        if self.state == BreakerState.HalfOpen:
+            self.reset_timeout = min(self.reset_timeout * 2, self.max_reset_timeout)
+            self._open()
+        elif self.state == BreakerState.Closed and self.failures >= self.failure_threshold:
+            self._open()
+
+    def _open(self):
+        self.state = BreakerState.Open
+        self.opened_at = time.monotonic()
@@ -0,0 +1,60 @@
+"""Tiered polling of heat pump registers."""
+import time
+
+# Seconds a group may be polled early, the coordinator schedules its next tick after the previous one finished
+POLL_SLACK = 2.0
+
+
+class RegisterGroup:
+    """ Register windows polled together at their own cadence """
+    """ interval is in seconds; None means once per authenticated session. """
+    """ windows is a tuple of (kind, start_idx, count). """
+
+    def __init__(self, name, interval, windows):
+        self.name = name
+        self.interval = interval
+        self.windows = windows
+
+    def windows_for(self, interest):
+        """ Windows narrowed to the registers in interest, a dict of kind to register indices """
+        """ Windows without any register of interest are dropped; None keeps all windows. """
+        if interest is None:
+            return list(self.windows)
+        windows = []
+        for kind, start_idx, count in self.windows:
+            wanted = [idx for idx in interest.get(kind, ()) if start_idx <= idx < start_idx + count]
+            if wanted:
+                windows.append((kind, min(wanted), max(wanted) - min(wanted) + 1))
+        return windows
+
+
+class PollScheduler:
+    """ Decides which register groups are due on a poll """
+
+    def __init__(self, groups):
+        self.groups = groups
+        self._last_polled = {}
+
+    def due(self, now=None):
+        """ Groups that should be fetched now """
+        now = time.monotonic() if now is None else now
+        return [group for group in self.groups if self._is_due(group, now)]
+
+    def _is_due(self, group, now):
+        last = self._last_polled.get(group.name)
+        if last is None:
+            return True
+        return group.interval is not None and now - last >= group.interval - POLL_SLACK
+
+    def mark_polled(self, groups, now=None):
+        now = time.monotonic() if now is None else now
+        for group in groups:
+            self._last_polled[group.name] = now
+
+    def expire(self, name):
+        """ Make one group due on the next poll, e.g. after writing to its registers """
+        self._last_polled.pop(name, None)
+
+    def reset(self):
+        """ Make every group due, e.g. on a new session or after a failed poll """
+        self._last_polled.clear()
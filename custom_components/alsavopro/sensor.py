@@ -4,6 +4,7 @@ from homeassistant.components.sensor import (
     SensorStateClass
 )
 from homeassistant.const import EntityCategory
+from homeassistant.core import callback
 
 from . import AlsavoProDataCoordinator, AlsavoProEntity
 from .const import (
@@ -234,10 +235,53 @@ async def async_setup_entry(hass, entry, async_add_devices):
                             EntityCategory.DIAGNOSTIC),
             AlsavoProErrorSensor(coordinator,
                                  "Error messages"),
+            AlsavoProMetricSensor(coordinator,
+                                  "Handshake time p50",
+                                  lambda handler: _milliseconds(handler.metrics.handshake.percentile(50))),
+            AlsavoProMetricSensor(coordinator,
+                                  "Handshake time p95",
+                                  lambda handler: _milliseconds(handler.metrics.handshake.percentile(95))),
+            AlsavoProMetricSensor(coordinator,
+                                  "Query RTT p50",
+                                  lambda handler: _milliseconds(handler.metrics.query.percentile(50))),
+            AlsavoProMetricSensor(coordinator,
+                                  "Query RTT p95",
+                                  lambda handler: _milliseconds(handler.metrics.query.percentile(95))),
+            AlsavoProMetricSensor(coordinator,
+                                  "Write latency p95",
+                                  lambda handler: _milliseconds(handler.metrics.write.percentile(95))),
+            AlsavoProMetricSensor(coordinator,
+                                  "Parse time p95",
+                                  lambda handler: _milliseconds(handler.metrics.parse.percentile(95), 3)),
+            AlsavoProMetricSensor(coordinator,
+                                  "Retries",
+                                  lambda handler: handler.metrics.retries,
+                                  None,
+                                  "mdi:reload",
+                                  SensorStateClass.TOTAL_INCREASING),
+            AlsavoProMetricSensor(coordinator,
+                                  "Retransmissions",
+                                  lambda handler: handler.retransmissions,
+                                  None,
+                                  "mdi:reload",
+                                  SensorStateClass.TOTAL_INCREASING),
+            AlsavoProMetricSensor(coordinator,
+                                  "Poll success ratio",
+                                  lambda handler: _percent(handler.metrics.success_ratio),
+                                  "%",
+                                  "mdi:check-network"),
         ]
     )
 
 
+def _milliseconds(seconds, digits=1):
+    return round(seconds * 1000, digits) if seconds is not None else None
+
+
+def _percent(ratio):
+    return round(ratio * 100, 1) if ratio is not None else None
+
+
 class AlsavoProSensor(AlsavoProEntity, CoordinatorEntity, SensorEntity):
     _attr_has_entity_name = True
 
@@ -258,6 +302,10 @@ class AlsavoProSensor(AlsavoProEntity, CoordinatorEntity, SensorEntity):
         self._attr_native_unit_of_measurement = unit
         self._dataIdx = idx
         self._config = from_config
+        if from_config:
+            self._config_registers = (idx,)
+        else:
+            self._status_registers = (idx,)
         self._icon = icon
         self._attr_entity_category = entity_category
         self._attr_state_class = state_class
@@ -272,7 +320,7 @@ class AlsavoProSensor(AlsavoProEntity, CoordinatorEntity, SensorEntity):
     @property
     def available(self) -> bool:
         """Return True if roller and hub is available."""
-        return self._data_handler.is_online
+        return self._data_handler.is_available
 
     @property
     def unique_id(self):
@@ -300,6 +348,7 @@ class AlsavoProSensor(AlsavoProEntity, CoordinatorEntity, SensorEntity):
 
 class AlsavoProErrorSensor(AlsavoProEntity, CoordinatorEntity, SensorEntity):
     _attr_has_entity_name = True
+    _status_registers = (48, 49)
 
     def __init__(self, coordinator: AlsavoProDataCoordinator,
                  name: str):
@@ -331,3 +380,49 @@ class AlsavoProErrorSensor(AlsavoProEntity, CoordinatorEntity, SensorEntity):
     async def async_update(self):
         """Get the latest data."""
         self._data_handler = self.data_coordinator.data_handler
+
+
+class AlsavoProMetricSensor(AlsavoProEntity, CoordinatorEntity, SensorEntity):
+    """Connection metric of the heat pump, disabled unless enabled in the entity registry."""
+    _attr_has_entity_name = True
+    _attr_entity_category = EntityCategory.DIAGNOSTIC
+    _attr_entity_registry_enabled_default = False
+
+    def __init__(self, coordinator: AlsavoProDataCoordinator,
+                 name: str,
+                 value,
+                 unit: str = "ms",
+                 icon: str = "mdi:timer-outline",
+                 state_class: SensorStateClass = SensorStateClass.MEASUREMENT):
+        super().__init__(coordinator)
+        self.data_coordinator = coordinator
+        self._data_handler = self.data_coordinator.data_handler
+        self._name = name
+        self._value = value
+        self._attr_native_unit_of_measurement = unit
+        self._attr_device_class = SensorDeviceClass.DURATION if unit == "ms" else None
+        self._icon = icon
+        self._attr_state_class = state_class
+
+    @property
+    def name(self):
+        """Return the name of the sensor."""
+        return self._name
+
+    @property
+    def unique_id(self):
+        """Return a unique ID."""
+        return f"{self._data_handler.unique_id}_{self._name}"
+
+    @property
+    def native_value(self):
+        return self._value(self._data_handler)
+
+    @property
+    def icon(self):
+        return self._icon
+
+    @callback
+    def _handle_coordinator_update(self) -> None:
+        """Write state on every update, the metrics change with each poll."""
+        self.async_write_ha_state()
@@ -1,68 +1,302 @@
 import asyncio
 import logging
+import time
+from collections import deque
+
+from .ratecontrol import AimdRateController, PRIORITY_POLL
 
 _LOGGER = logging.getLogger(__name__)
 
+# Retransmission timeout bounds in seconds, see RFC 6298
+RTO_INITIAL = 1.0
+RTO_MIN = 0.2
+RTO_MAX = 5.0
+# Number of times a request is re-sent before giving up
+MAX_RETRANSMITS = 2
+# Seconds a handshake transmission on a shared endpoint waits for its reply, others queue behind it
+SHARED_HANDSHAKE_TIMEOUT = 1.0
 
-class UDPClient:
-    """ Async UDP client """
-    def __init__(self, server_host, server_port):
+
+class RttEstimator:
+    """ Smoothed round trip time and variance of one endpoint, giving the retransmission timeout """
+    def __init__(self, rto_initial=RTO_INITIAL, rto_min=RTO_MIN, rto_max=RTO_MAX):
+        self.srtt = None
+        self.rttvar = None
+        self.min_rtt = None
+        self.rto_min = rto_min
+        self.rto_max = rto_max
+        self.rto = rto_initial
+
+    def sample(self, rtt):
+        """ Feed the round trip time of a request that was answered without being retransmitted """
+        if self.min_rtt is None or rtt < self.min_rtt:
+            self.min_rtt = rtt
+        if self.srtt is None:
+            self.srtt = rtt
+            self.rttvar = rtt / 2
+        else:
+            self.rttvar = 0.75 * self.rttvar + 0.25 * abs(self.srtt - rtt)
+            self.srtt = 0.875 * self.srtt + 0.125 * rtt
+        self.rto = min(max(self.srtt + 4 * self.rttvar, self.rto_min), self.rto_max)
+
+    def backoff(self):
+        """ Double the timeout after a loss """
+        self.rto = min(self.rto * 2, self.rto_max)
+
+
+class DatagramEndpoint(asyncio.DatagramProtocol):
+    """ One UDP socket to a remote address """
+    """ Incoming datagrams are matched to pending requests through the key returned by reply_key(datagram), """
+    """ so several requests, possibly of different sessions, can be in flight at once and stray datagrams """
+    """ are dropped. Until a reply echoed the sequence number of its request, a reply without an exact match """
+    """ goes to the oldest pending request of its session, in case the firmware numbers replies on its own. """
+    def __init__(self, server_host, server_port, reply_key=None, rate_controller=None):
         self.server_host = server_host
         self.server_port = server_port
-        self.loop = asyncio.get_event_loop()
+        self.transport = None
+        self.users = 0
+        self.closed = False
+        self.seq_echoed = False
+        self.rate_controller = rate_controller
+        # Handshake replies can only be told apart by arrival, so one handshake transmission is awaited at a time
+        self.handshake_lock = asyncio.Lock()
+        self._reply_key = reply_key
+        self._pending = {}
+        self._opening = None
 
-    class SimpleClientProtocol(asyncio.DatagramProtocol):
-        # Sending only
-        def __init__(self, message):
-            self.message = message
-            self.transport = None
+    @property
+    def is_open(self):
+        return self.transport is not None and not self.transport.is_closing()
 
-        def connection_made(self, transport):
-            self.transport = transport
-            self.transport.sendto(self.message)
-            self.transport.close()
+    async def open(self):
+        """ Open the socket, concurrent callers wait for the same one """
+        if self._opening is None:
+            self._opening = asyncio.ensure_future(self._create_endpoint())
+        await asyncio.shield(self._opening)
 
-    class EchoClientProtocol(asyncio.DatagramProtocol):
-        # Send and receive
-        def __init__(self, message, future):
-            self.message = message
-            self.future = future
+    async def _create_endpoint(self):
+        _LOGGER.debug(f"Opening UDP endpoint to {self.server_host}:{self.server_port}")
+        await asyncio.get_running_loop().create_datagram_endpoint(
+            lambda: self,
+            remote_addr=(self.server_host, self.server_port)
+        )
+
+    def close(self):
+        self.closed = True
+        if self.transport is not None:
+            self.transport.close()
             self.transport = None
 
-        def connection_made(self, transport):
-            self.transport = transport
-            self.transport.sendto(self.message)
+    def sendto(self, data):
+        if not self.is_open:
+            raise ConnectionError("UDP endpoint closed")
+        self.transport.sendto(data)
 
-        def datagram_received(self, data, addr):
-            self.future.set_result(data)
-            self.transport.close()
+    def add_waiter(self, key, future):
+        self._pending.setdefault(key, deque()).append(future)
 
-        def error_received(self, exc):
-            self.future.set_exception(exc)
+    def remove_waiter(self, key, future):
+        waiters = self._pending.get(key)
+        if waiters is not None:
+            if future in waiters:
+                waiters.remove(future)
+            if not waiters:
+                del self._pending[key]
 
-        def connection_lost(self, exc):
-            if not self.future.done():
-                self.future.set_exception(ConnectionError("Connection lost"))
+    def _match(self, data):
+        if self._reply_key is None:
+            return self._pending.get(None)
+        try:
+            csid, seq = self._reply_key(data)
+        except Exception:
+            return None
+        waiters = self._pending.get((csid, seq))
+        if waiters:
+            if seq:
+                self.seq_echoed = True
+            return waiters
+        # Handshake requests are sent before the CSID is known and wait on a wildcard CSID
+        waiters = self._pending.get((None, seq))
+        if waiters or self.seq_echoed:
+            return waiters
+        for pending_csid in (csid, None):
+            for key, waiters in self._pending.items():
+                if key[0] == pending_csid and waiters:
+                    return waiters
+        return None
 
-    async def send_rcv(self, bytes_to_send):
-        future = self.loop.create_future()
-        transport, protocol = await self.loop.create_datagram_endpoint(
-            lambda: self.EchoClientProtocol(bytes_to_send, future),
-            remote_addr=(self.server_host, self.server_port)
-        )
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data, addr):
+        waiters = self._match(data)
+        while waiters:
+            future = waiters.popleft()
+            if not future.done():
+                future.set_result(data)
+                return
+        _LOGGER.debug("Dropping unsolicited, late or duplicate datagram")
+
+    def error_received(self, exc):
+        self.fail_waiters(exc)
+
+    def connection_lost(self, exc):
+        self.transport = None
+        self.closed = True
+        self.fail_waiters(exc or ConnectionError("Connection lost"))
+
+    def fail_waiters(self, exc):
+        for waiters in self._pending.values():
+            for future in waiters:
+                if not future.done():
+                    future.set_exception(exc)
+            waiters.clear()
+
+
+_shared_endpoints = {}
+
+
+async def acquire_shared_endpoint(server_host, server_port, reply_key):
+    """ Endpoint shared by every session talking to the same remote address, e.g. the cloud relay """
+    """ It is registered before its socket is opened, so sessions set up concurrently share it as well. """
+    endpoint = _shared_endpoints.get((server_host, server_port))
+    if endpoint is None or endpoint.closed:
+        endpoint = DatagramEndpoint(server_host, server_port, reply_key, AimdRateController())
+        _shared_endpoints[(server_host, server_port)] = endpoint
+    endpoint.users += 1
+    try:
+        await endpoint.open()
+    except BaseException:
+        release_shared_endpoint(endpoint)
+        raise
+    return endpoint
+
+
+def release_shared_endpoint(endpoint):
+    endpoint.users -= 1
+    if endpoint.users <= 0:
+        endpoint.close()
+        if _shared_endpoints.get((endpoint.server_host, endpoint.server_port)) is endpoint:
+            del _shared_endpoints[(endpoint.server_host, endpoint.server_port)]
+
+
+class UDPClient:
+    """ Async UDP client """
+    """ Sends the requests of one device over a long-lived DatagramEndpoint, either its own or one shared """
+    """ with all other devices behind the same remote address. """
+    def __init__(self, server_host, server_port, reply_key=None, shared=False):
+        self.server_host = server_host
+        self.server_port = server_port
+        self.shared = shared
+        self.loop = asyncio.get_event_loop()
+        self._reply_key = reply_key
+        self._endpoint = None
+        self.rtt_estimator = RttEstimator()
+        self.retransmissions = 0
+
+    @property
+    def rtt(self):
+        """ Smoothed round trip time in seconds, None until the first reply """
+        return self.rtt_estimator.srtt
+
+    @property
+    def is_open(self):
+        return self._endpoint is not None and self._endpoint.is_open
+
+    async def open(self):
+        """ Open the datagram endpoint unless it is already open """
+        if self.is_open:
+            return
+        self.close()
+        if self.shared:
+            self._endpoint = await acquire_shared_endpoint(self.server_host, self.server_port, self._reply_key)
+        else:
+            self._endpoint = DatagramEndpoint(self.server_host, self.server_port, self._reply_key)
+            await self._endpoint.open()
+
+    def close(self):
+        if self._endpoint is not None:
+            if self.shared:
+                release_shared_endpoint(self._endpoint)
+            else:
+                self._endpoint.close()
+            self._endpoint = None
+
+    async def send_rcv(self, bytes_to_send, key=None, retransmits=MAX_RETRANSMITS, priority=PRIORITY_POLL,
+                       congestion_signal=True):
+        """ Send a request and wait for the reply matching key, a (csid, seq) tuple """
+        """ The request is re-sent when no reply arrives within the current retransmission timeout. """
+        """ Timeouts are reported to the rate controller as congestion unless congestion_signal is False, """
+        """ e.g. for requests the device may never answer; handshakes only once the device has answered. """
+        """ On a rate controlled endpoint it first waits for a slot, served by priority. Handshakes on a """
+        """ shared endpoint instead take turns per transmission and wait at most SHARED_HANDSHAKE_TIMEOUT, """
+        """ so a silent pump delays the handshakes of the others by no more than that. """
+        """ Returns (reply, rtt), rtt is None for a reply to a retransmission, or None without a reply. """
+        await self.open()
+        endpoint = self._endpoint
+        handshake = self.shared and key is not None and key[0] is None
+        controller = endpoint.rate_controller
+        # A device that never answered is more likely offline than the endpoint congested
+        congestion_signal = congestion_signal and not (handshake and self.rtt_estimator.srtt is None)
+        # The handshake lock already keeps handshakes to one in flight
+        slot = controller is not None and not handshake
+        if slot:
+            await controller.acquire(priority)
+        future = None
+        if not handshake:
+            future = self.loop.create_future()
+            endpoint.add_waiter(key, future)
 
         try:
-            data = await asyncio.wait_for(future, timeout=5.0)
-            return data, b'0'
-        except asyncio.TimeoutError:
-            _LOGGER.error("Timeout: No response from server in 5 seconds.")
+            for attempt in range(retransmits + 1):
+                if attempt:
+                    self.retransmissions += 1
+                timeout = self.rtt_estimator.rto
+                try:
+                    if handshake:
+                        data, rtt = await self._send_handshake(endpoint, bytes_to_send, key,
+                                                               min(timeout, SHARED_HANDSHAKE_TIMEOUT))
+                    else:
+                        sent = time.monotonic()
+                        endpoint.sendto(bytes_to_send)
+                        data = await asyncio.wait_for(asyncio.shield(future), timeout=timeout)
+                        rtt = time.monotonic() - sent
+                except asyncio.TimeoutError:
+                    _LOGGER.debug(f"No reply within {timeout:.3f}s (attempt {attempt + 1})")
+                    self.rtt_estimator.backoff()
+                    if controller is not None and congestion_signal:
+                        controller.on_timeout()
+                    continue
+                if attempt:
+                    # Karn's algorithm: a reply to a retransmitted request can't be timed reliably
+                    return data, None
+                self.rtt_estimator.sample(rtt)
+                if controller is not None:
+                    controller.on_reply(rtt, self.rtt_estimator.min_rtt)
+                return data, rtt
+            _LOGGER.error(f"Timeout: No response from server after {retransmits + 1} attempts.")
             return None
         finally:
-            transport.close()
+            if future is not None:
+                future.cancel()
+                endpoint.remove_waiter(key, future)
+            if slot:
+                controller.release()
+
+    async def _send_handshake(self, endpoint, bytes_to_send, key, timeout):
+        """ One handshake transmission, holding the handshake lock until its reply or timeout """
+        async with endpoint.handshake_lock:
+            future = self.loop.create_future()
+            endpoint.add_waiter(key, future)
+            try:
+                sent = time.monotonic()
+                endpoint.sendto(bytes_to_send)
+                data = await asyncio.wait_for(future, timeout=timeout)
+                return data, time.monotonic() - sent
+            finally:
+                future.cancel()
+                endpoint.remove_waiter(key, future)
 
     async def send(self, bytes_to_send):
-        transport, protocol = await self.loop.create_datagram_endpoint(
-            lambda: self.SimpleClientProtocol(bytes_to_send),
-            remote_addr=(self.server_host, self.server_port)
-        )
-        transport.close()
+        await self.open()
+        self._endpoint.sendto(bytes_to_send)
@@ -0,0 +1,278 @@
+"""Benchmarks of the protocol hot paths and of a full poll cycle against the simulator.
+
+    python -m scripts.benchmark             # run and compare with scripts/benchmark_baseline.json
+    python -m scripts.benchmark --save      # run and store the results as the new baseline
+    python -m scripts.benchmark --check     # exit with status 1 on a regression against the baseline
+    python -m scripts.benchmark -k unpack   # only benchmarks with unpack in their name
+
+Every benchmark reports operations per second, p50/p99 latency of one operation and its allocations: the
+peak of traced memory while one operation runs and the bytes still allocated after it.
+
+Latencies are absolute and only comparable on the same machine. The checked-in baseline shows what to
+expect; before comparing with --check, save a baseline on your machine from the commit you start from.
+"""
+import argparse
+import asyncio
+import gc
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+from custom_components.alsavopro.AlsavoPyCtrl import AlsavoPro, QueryResponse
+from custom_components.alsavopro.codec import PacketHeader, HDR_REQUEST, CMD_DATA, KIND_ALL, QUERY_ALL, \
+    encode_packet, encode_query_response
+from custom_components.alsavopro.const import DOMAIN, POLL_GROUPS, POLL_GROUP_FAST
+from scripts.simulator import VirtualPump, create_pumps, serve, DEFAULT_PASSWORD
+
+BASELINE = os.path.join(os.path.dirname(__file__), 'benchmark_baseline.json')
+# Seconds each benchmark runs, batches of fast operations are timed together for at least BATCH_TIME
+DURATION = 0.5
+BATCH_TIME = 0.001
+# Timing runs per benchmark, the fastest counts as in timeit since slower runs measure interference
+REPEAT = 5
+ALLOCATION_SAMPLES = 50
+# Allowed p50 slowdown against the baseline, sub-microsecond benchmarks vary by tens of percent between runs
+TOLERANCE = 0.5
+
+_BENCHMARKS = {}
+
+
+def benchmark(name):
+    """ Register an async setup function returning (operation, cleanup), cleanup may be None """
+    def register(setup):
+        _BENCHMARKS[name] = setup
+        return setup
+    return register
+
+
+def _query_all_payload():
+    return encode_query_response(0x08, VirtualPump(1000).read([(KIND_ALL, 0, 0)]))
+
+
+@benchmark('header_pack')
+async def _header_pack():
+    header = PacketHeader(HDR_REQUEST, 1, 0x1234, 0x5678, CMD_DATA, 12)
+    return header.pack, None
+
+
+@benchmark('header_unpack')
+async def _header_unpack():
+    data = bytes(PacketHeader(HDR_REQUEST, 1, 0x1234, 0x5678, CMD_DATA, 12).pack())
+    return lambda: PacketHeader.unpack(data), None
+
+
+@benchmark('packet_encode')
+async def _packet_encode():
+    return lambda: encode_packet(1, 0x1234, 0x5678, CMD_DATA, QUERY_ALL), None
+
+
+@benchmark('query_response_unpack')
+async def _query_response_unpack():
+    payload = _query_all_payload()
+    return lambda: QueryResponse.unpack(payload), None
+
+
+@benchmark('query_response_unpack_telemetry')
+async def _query_response_unpack_telemetry():
+    kind, start_idx, count = POLL_GROUPS[POLL_GROUP_FAST][1][0]
+    payload = encode_query_response(0x08, VirtualPump(1000).read([(kind, start_idx, count)]))
+    return lambda: QueryResponse.unpack(payload), None
+
+
+@benchmark('sensor_properties')
+async def _sensor_properties():
+    """ State of every entity in sensor.py, as read when HA writes their states """
+    from custom_components.alsavopro import AlsavoProDataCoordinator
+    from custom_components.alsavopro import sensor
+
+    handler = AlsavoPro('benchmark', '1000', '127.0.0.1', 1194, DEFAULT_PASSWORD)
+    handler.restore(_query_all_payload(), datetime.now(timezone.utc))
+    hass = SimpleNamespace(data={DOMAIN: {}})
+    hass.data[DOMAIN]['benchmark'] = AlsavoProDataCoordinator(hass, handler)
+    entities = []
+    await sensor.async_setup_entry(hass, SimpleNamespace(entry_id='benchmark'), entities.extend)
+
+    def evaluate():
+        for entity in entities:
+            entity.native_value
+            entity.available
+    return evaluate, handler.close
+
+
+async def _poll_cycle(groups):
+    """ The allocation peak of a poll includes the 256 KiB buffer asyncio reads each datagram into """
+    pump = create_pumps(1)[0]
+    simulator = await serve([pump])
+    handler = AlsavoPro('benchmark', str(pump.serial), '127.0.0.1', simulator.port, DEFAULT_PASSWORD)
+    await handler.update()
+
+    async def poll():
+        for name in groups:
+            handler.expire_poll_group(name)
+        await handler.update()
+
+    def cleanup():
+        handler.close()
+        simulator.transport.close()
+    return poll, cleanup
+
+
+@benchmark('poll_cycle')
+async def _poll_cycle_all():
+    """ AlsavoPro.update() fetching every register group from a simulated pump on localhost """
+    return await _poll_cycle(list(POLL_GROUPS))
+
+
+@benchmark('poll_cycle_telemetry')
+async def _poll_cycle_telemetry():
+    """ AlsavoPro.update() when only the telemetry group is due """
+    return await _poll_cycle([POLL_GROUP_FAST])
+
+
+async def _time(operation, duration):
+    """ Per operation latencies in seconds and operations per second """
+    is_async = asyncio.iscoroutinefunction(operation)
+    batch = 1
+    if not is_async:
+        # Time fast operations in batches, the clock would dominate single calls
+        while True:
+            started = time.perf_counter()
+            for _ in range(batch):
+                operation()
+            if time.perf_counter() - started >= BATCH_TIME:
+                break
+            batch *= 2
+    latencies = []
+    operations = 0
+    started = time.perf_counter()
+    end = started + duration
+    while time.perf_counter() < end:
+        batch_started = time.perf_counter()
+        if is_async:
+            await operation()
+        else:
+            for _ in range(batch):
+                operation()
+        latencies.append((time.perf_counter() - batch_started) / batch)
+        operations += batch
+    return latencies, operations / (time.perf_counter() - started)
+
+
+async def _allocations(operation):
+    """ Median peak traced bytes of one operation and mean bytes it left allocated """
+    is_async = asyncio.iscoroutinefunction(operation)
+    peaks = []
+    retained = []
+    tracemalloc.start()
+    try:
+        for _ in range(ALLOCATION_SAMPLES):
+            tracemalloc.reset_peak()
+            before = tracemalloc.get_traced_memory()[0]
+            if is_async:
+                await operation()
+            else:
+                operation()
+            current, peak = tracemalloc.get_traced_memory()
+            peaks.append(peak - before)
+            retained.append(current - before)
+    finally:
+        tracemalloc.stop()
+    return statistics.median(peaks), statistics.mean(retained)
+
+
+async def run(names, duration=DURATION, repeat=REPEAT):
+    results = {}
+    for name in names:
+        operation, cleanup = await _BENCHMARKS[name]()
+        try:
+            # Warm up caches, the session and the RTT estimate
+            for _ in range(3):
+                if asyncio.iscoroutinefunction(operation):
+                    await operation()
+                else:
+                    operation()
+            runs = []
+            for _ in range(repeat):
+                gc.collect()
+                latencies, ops_per_sec = await _time(operation, duration)
+                latencies.sort()
+                runs.append((latencies[len(latencies) // 2], latencies, ops_per_sec))
+            _, latencies, ops_per_sec = min(runs, key=lambda run: run[0])
+            peak, retained = await _allocations(operation)
+        finally:
+            if cleanup is not None:
+                cleanup()
+        results[name] = {
+            'ops_per_sec': ops_per_sec,
+            'p50_us': latencies[len(latencies) // 2] * 1e6,
+            'p99_us': latencies[min(len(latencies) - 1, len(latencies) * 99 // 100)] * 1e6,
+            'alloc_peak_bytes': peak,
+            'alloc_retained_bytes': retained,
+        }
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """ Print results next to the baseline, returns the names of regressed benchmarks """
+    regressions = []
+    print(f"{'benchmark':34} {'ops/s':>12} {'p50 us':>10} {'p99 us':>10} {'peak B':>8} {'kept B':>8}  vs baseline")
+    for name, result in results.items():
+        line = (f"{name:34} {result['ops_per_sec']:12.0f} {result['p50_us']:10.2f} {result['p99_us']:10.2f} "
+                f"{result['alloc_peak_bytes']:8.0f} {result['alloc_retained_bytes']:8.0f}")
+        base = baseline.get(name)
+        if base is not None:
+            change = result['p50_us'] / base['p50_us'] - 1
+            line += f"  p50 {change:+.0%}"
+            if change > tolerance:
+                line += "  REGRESSION"
+                regressions.append(name)
+        print(line)
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('-k', dest='pattern', default='', help="only run benchmarks containing this text")
+    parser.add_argument('--duration', type=float, default=DURATION, help="seconds per timing run")
+    parser.add_argument('--repeat', type=int, default=REPEAT, help="timing runs, the fastest is reported")
+    parser.add_argument('--baseline', default=BASELINE)
+    parser.add_argument('--save', action='store_true', help="store the results as the baseline")
+    parser.add_argument('--check', action='store_true',
+                        help="exit with status 1 if a p50 latency regressed by more than the tolerance")
+    parser.add_argument('--tolerance', type=float, default=TOLERANCE,
+                        help="allowed p50 slowdown against the baseline, 0.5 = 50%%")
+    args = parser.parse_args(argv)
+
+    names = [name for name in _BENCHMARKS if args.pattern in name]
+    results = asyncio.run(run(names, args.duration, args.repeat))
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as file:
+            baseline = json.load(file)['results']
+    regressions = compare(results, baseline, args.tolerance)
+
+    if args.save:
+        with open(args.baseline, 'w') as file:
+            json.dump({
+                'python': platform.python_version(),
+                'machine': platform.machine(),
+                'saved': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+                'results': {**baseline, **results},
+            }, file, indent=2, sort_keys=True)
+            file.write('\n')
+        print(f"Saved baseline to {args.baseline}")
+    elif regressions:
+        print(f"Regressed: {', '.join(regressions)}")
+        if args.check:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
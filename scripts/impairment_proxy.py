@@ -0,0 +1,298 @@
+"""UDP proxy injecting delay, loss, duplication and reordering between the integration and a pump.
+
+All random decisions come from one seeded generator, so a run can be repeated packet for packet:
+
+    python -m scripts.impairment_proxy proxy --target 127.0.0.1:1194 --port 11194 --loss 0.05 --delay uniform:0.02,0.2
+
+The measure command runs a simulated pump behind the proxy and reports the poll success rate, poll latency
+and the time to recover from an outage for a list of loss rates:
+
+    python -m scripts.impairment_proxy measure --loss 0 0.05 0.2
+"""
+import argparse
+import asyncio
+import logging
+import random
+import time
+
+_LOGGER = logging.getLogger(__name__)
+
+
+def parse_delay(spec):
+    """ Delay distribution from a spec like fixed:0.05, uniform:0.02,0.2, normal:0.1,0.02 or exp:0.05 """
+    """ Returns a function of a random.Random giving the delay in seconds, never negative. """
+    name, _, params = spec.partition(':')
+    args = [float(arg) for arg in params.split(',')] if params else []
+    if name == 'fixed':
+        return lambda rng: args[0]
+    if name == 'uniform':
+        return lambda rng: rng.uniform(args[0], args[1])
+    if name == 'normal':
+        return lambda rng: max(0.0, rng.gauss(args[0], args[1]))
+    if name == 'exp':
+        return lambda rng: rng.expovariate(1 / args[0])
+    raise ValueError(f"Unknown delay distribution {spec!r}")
+
+
+class Impairment:
+    """ What happens to datagrams in one direction """
+    """ Each datagram is lost with probability loss, otherwise delivered after delay(rng) seconds. """
+    """ With probability duplicate a second copy follows, with probability reorder it is held back another """
+    """ reorder_delay seconds so that later datagrams overtake it. While down, everything is lost. """
+
+    def __init__(self, loss=0.0, delay=None, duplicate=0.0, reorder=0.0, reorder_delay=0.05):
+        self.loss = loss
+        self.delay = delay
+        self.duplicate = duplicate
+        self.reorder = reorder
+        self.reorder_delay = reorder_delay
+        self.down = False
+
+    def delays(self, rng):
+        """ Delivery delays of the copies of one datagram, empty if it is lost """
+        if self.down or rng.random() < self.loss:
+            return []
+        copies = 2 if rng.random() < self.duplicate else 1
+        delays = []
+        for _ in range(copies):
+            delay = self.delay(rng) if self.delay is not None else 0.0
+            if rng.random() < self.reorder:
+                delay += self.reorder_delay
+            delays.append(delay)
+        return delays
+
+
+class DirectionStats:
+    __slots__ = ('received', 'delivered', 'lost', 'duplicated')
+
+    def __init__(self):
+        self.received = 0
+        self.delivered = 0
+        self.lost = 0
+        self.duplicated = 0
+
+    def __repr__(self):
+        return (f"received={self.received} delivered={self.delivered} lost={self.lost} "
+                f"duplicated={self.duplicated}")
+
+
+class _Upstream(asyncio.DatagramProtocol):
+    """ Socket towards the target for one client, so replies find their way back """
+
+    def __init__(self, proxy, client_addr):
+        self.proxy = proxy
+        self.client_addr = client_addr
+        self.transport = None
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data, addr):
+        self.proxy.forward(self.proxy.downstream, self.proxy.downstream_stats, self.proxy.transport, data,
+                           self.client_addr)
+
+
+class ImpairmentProxy(asyncio.DatagramProtocol):
+    """ Forwards datagrams between clients and a target, impairing both directions """
+    """ upstream applies to client to target, downstream to target to client; they may be the same object. """
+
+    def __init__(self, target, upstream, downstream=None, seed=0):
+        self.target = target
+        self.upstream = upstream
+        self.downstream = downstream if downstream is not None else upstream
+        self.upstream_stats = DirectionStats()
+        self.downstream_stats = DirectionStats()
+        self.transport = None
+        self._random = random.Random(seed)
+        self._clients = {}
+        self._connecting = {}
+
+    @property
+    def port(self):
+        return self.transport.get_extra_info('sockname')[1]
+
+    def set_down(self, down):
+        """ Drop all traffic in both directions, e.g. to measure the time to recover from an outage """
+        self.upstream.down = down
+        self.downstream.down = down
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data, addr):
+        upstream = self._clients.get(addr)
+        if upstream is not None:
+            self.forward(self.upstream, self.upstream_stats, upstream.transport, data)
+            return
+        # The first datagram of a client waits for its upstream socket
+        self._connecting.setdefault(addr, []).append(data)
+        if self._connecting[addr].__len__() == 1:
+            asyncio.ensure_future(self._connect(addr))
+
+    async def _connect(self, addr):
+        _LOGGER.debug(f"New client {addr}")
+        loop = asyncio.get_running_loop()
+        _, upstream = await loop.create_datagram_endpoint(lambda: _Upstream(self, addr), remote_addr=self.target)
+        self._clients[addr] = upstream
+        for data in self._connecting.pop(addr):
+            self.forward(self.upstream, self.upstream_stats, upstream.transport, data)
+
+    def forward(self, impairment, stats, transport, data, addr=None):
+        stats.received += 1
+        delays = impairment.delays(self._random)
+        if not delays:
+            stats.lost += 1
+            return
+        stats.duplicated += delays.__len__() - 1
+        loop = asyncio.get_running_loop()
+        for delay in delays:
+            if delay > 0:
+                loop.call_later(delay, self._deliver, stats, transport, data, addr)
+            else:
+                self._deliver(stats, transport, data, addr)
+
+    @staticmethod
+    def _deliver(stats, transport, data, addr):
+        if transport.is_closing():
+            return
+        stats.delivered += 1
+        if addr is None:
+            transport.sendto(data)
+        else:
+            transport.sendto(data, addr)
+
+    def close(self):
+        for upstream in self._clients.values():
+            upstream.transport.close()
+        self._clients.clear()
+        if self.transport is not None:
+            self.transport.close()
+
+
+async def start_proxy(target, upstream, downstream=None, host='127.0.0.1', port=0, seed=0):
+    """ Listen on host:port, 0 picks a free port, and forward to the (host, port) target """
+    _, proxy = await asyncio.get_running_loop().create_datagram_endpoint(
+        lambda: ImpairmentProxy(target, upstream, downstream, seed),
+        local_addr=(host, port)
+    )
+    return proxy
+
+
+async def measure(loss, polls=100, interval=0.1, outage=5.0, delay=None, seed=0):
+    """ Poll a simulated pump through the proxy at the given loss rate """
+    """ Returns the poll success rate, p50/p95 poll latency in seconds and the seconds from the end of an """
+    """ outage to the next successful poll. """
+    from custom_components.alsavopro.AlsavoPyCtrl import AlsavoPro
+    from custom_components.alsavopro.const import POLL_GROUPS
+    from custom_components.alsavopro.fleet import percentile
+    from scripts.simulator import create_pumps, serve
+
+    pump = create_pumps(1)[0]
+    simulator = await serve([pump])
+    proxy = await start_proxy(('127.0.0.1', simulator.port), Impairment(loss, delay), seed=seed)
+    handler = AlsavoPro('measure', str(pump.serial), '127.0.0.1', proxy.port, 'simulator')
+
+    async def poll():
+        # Every poll fetches all groups so each one costs the same
+        for name in POLL_GROUPS:
+            handler.expire_poll_group(name)
+        await handler.update()
+        return handler.is_online
+
+    healed = None
+
+    def heal():
+        nonlocal healed
+        proxy.set_down(False)
+        healed = time.monotonic()
+
+    try:
+        succeeded = 0
+        latencies = []
+        for _ in range(polls):
+            started = time.monotonic()
+            if await poll():
+                succeeded += 1
+                latencies.append(time.monotonic() - started)
+            await asyncio.sleep(interval)
+
+        # Keep polling through the outage, so retries and the circuit breaker react as they would in HA
+        proxy.set_down(True)
+        asyncio.get_running_loop().call_later(outage, heal)
+        while not (await poll() and healed is not None):
+            await asyncio.sleep(interval)
+        return {
+            'loss': loss,
+            'success_rate': succeeded / polls,
+            'latency_p50': percentile(latencies, 50),
+            'latency_p95': percentile(latencies, 95),
+            'time_to_recover': time.monotonic() - healed,
+            'upstream': repr(proxy.upstream_stats),
+            'downstream': repr(proxy.downstream_stats),
+        }
+    finally:
+        handler.close()
+        proxy.close()
+        simulator.transport.close()
+
+
+def _address(value):
+    host, _, port = value.rpartition(':')
+    return host, int(port)
+
+
+async def _proxy(args):
+    impairment = Impairment(args.loss, parse_delay(args.delay) if args.delay else None, args.duplicate,
+                            args.reorder, args.reorder_delay)
+    proxy = await start_proxy(args.target, impairment, host=args.host, port=args.port, seed=args.seed)
+    print(f"Forwarding {args.host}:{proxy.port} to {args.target[0]}:{args.target[1]}")
+    try:
+        while True:
+            await asyncio.sleep(args.report_interval)
+            print(f"up: {proxy.upstream_stats}  down: {proxy.downstream_stats}")
+    finally:
+        proxy.close()
+
+
+async def _measure(args):
+    delay = parse_delay(args.delay) if args.delay else None
+    for loss in args.loss:
+        result = await measure(loss, args.polls, args.interval, args.outage, delay, args.seed)
+        print(' '.join(f"{key}={value:.3f}" if isinstance(value, float) else f"{key}={value}"
+                       for key, value in result.items()))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    proxy = commands.add_parser('proxy', help="forward datagrams to a target")
+    proxy.add_argument('--target', type=_address, required=True, help="host:port of the pump or simulator")
+    proxy.add_argument('--host', default='127.0.0.1')
+    proxy.add_argument('--port', type=int, default=0)
+    proxy.add_argument('--loss', type=float, default=0.0, help="probability a datagram is dropped")
+    proxy.add_argument('--delay', help="delay distribution, e.g. fixed:0.05 or uniform:0.02,0.2")
+    proxy.add_argument('--duplicate', type=float, default=0.0, help="probability a datagram is sent twice")
+    proxy.add_argument('--reorder', type=float, default=0.0, help="probability a datagram is held back")
+    proxy.add_argument('--reorder-delay', type=float, default=0.05, help="seconds a held back datagram waits")
+    proxy.add_argument('--seed', type=int, default=0)
+    proxy.add_argument('--report-interval', type=float, default=10.0)
+
+    run = commands.add_parser('measure', help="measure polling through the proxy against a simulated pump")
+    run.add_argument('--loss', type=float, nargs='+', default=[0.0, 0.05, 0.2])
+    run.add_argument('--delay', help="delay distribution, e.g. uniform:0.02,0.2")
+    run.add_argument('--polls', type=int, default=100)
+    run.add_argument('--interval', type=float, default=0.1, help="seconds between polls")
+    run.add_argument('--outage', type=float, default=5.0, help="seconds all traffic is dropped")
+    run.add_argument('--seed', type=int, default=0)
+
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.WARNING)
+    try:
+        asyncio.run(_proxy(args) if args.command == 'proxy' else _measure(args))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
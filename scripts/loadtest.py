@@ -0,0 +1,198 @@
+"""Load test of many heat pumps polled by the fleet scheduler against simulated pumps.
+
+    python -m scripts.loadtest --devices 200 --duration 60
+    python -m scripts.loadtest --devices 200 --shared   # all pumps behind one port over one socket
+    python -m scripts.loadtest --devices 200 --unreachable 5   # and 5 pumps that never answer
+
+Every device gets an AlsavoPro handler and the real AlsavoProDataCoordinator, polled by AlsavoProFleet at a
+fixed interval. Reports achieved polls per second, missed ticks, event loop lag, CPU time per poll, memory
+per device and open file descriptors. Polls of unreachable pumps count as failures of the fleet cycle.
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import resource
+import socket
+import time
+import tracemalloc
+
+from custom_components.alsavopro import AlsavoProDataCoordinator
+from custom_components.alsavopro.AlsavoPyCtrl import AlsavoPro
+from custom_components.alsavopro.const import FLEET_MAX_CONCURRENT_POLLS
+from custom_components.alsavopro.fleet import AlsavoProFleet, percentile
+from scripts.simulator import create_pumps, serve_fleet, run_drift, DEFAULT_PASSWORD
+
+# Seconds between event loop lag probes
+LAG_PROBE_INTERVAL = 0.1
+
+
+class _Hass:
+    """ The parts of HomeAssistant used by the coordinator outside of entity setup """
+
+    def __init__(self):
+        self.data = {}
+        self.loop = asyncio.get_running_loop()
+
+    def async_create_task(self, target, name=None, eager_start=False):
+        return self.loop.create_task(target, name=name)
+
+    def async_create_background_task(self, target, name, eager_start=False):
+        return self.loop.create_task(target, name=name)
+
+
+class _Device:
+    __slots__ = ('handler', 'coordinator', 'started', 'polls', 'failures', 'first_poll')
+
+    def __init__(self, handler, coordinator):
+        self.handler = handler
+        self.coordinator = coordinator
+        self.started = 0
+        self.polls = 0
+        self.failures = 0
+        self.first_poll = None
+
+    async def refresh(self):
+        if self.first_poll is None:
+            self.first_poll = time.monotonic()
+        self.started += 1
+        await self.coordinator.async_refresh()
+        self.polls += 1
+        if not self.handler.is_online:
+            self.failures += 1
+        return self.handler.is_online
+
+
+def _raise_file_limit():
+    """ Every device uses a socket, and one more on the simulator unless it is shared """
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft < hard:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+
+
+def _open_files():
+    try:
+        return os.listdir('/proc/self/fd').__len__()
+    except OSError:
+        return None
+
+
+async def _probe_lag(lags):
+    loop = asyncio.get_running_loop()
+    while True:
+        expected = loop.time() + LAG_PROBE_INTERVAL
+        await asyncio.sleep(LAG_PROBE_INTERVAL)
+        lags.append(loop.time() - expected)
+
+
+async def run(devices, duration, interval, shared=False, max_concurrency=FLEET_MAX_CONCURRENT_POLLS,
+              drift_interval=5.0, unreachable=0):
+    _raise_file_limit()
+    hass = _Hass()
+    pumps = create_pumps(devices)
+    simulators = await serve_fleet(pumps, shared=shared)
+    drift = asyncio.ensure_future(run_drift(simulators, drift_interval))
+
+    # Memory of handlers and coordinators after their first poll, the simulator is not traced
+    tracemalloc.start()
+    fleet_devices = []
+    for i, pump in enumerate(pumps):
+        simulator = simulators[0] if shared else simulators[i]
+        handler = AlsavoPro(f"pump {pump.serial}", str(pump.serial), '127.0.0.1', simulator.port,
+                            DEFAULT_PASSWORD, shared_socket=shared)
+        fleet_devices.append(_Device(handler, AlsavoProDataCoordinator(hass, handler)))
+    # A bound socket nobody reads from, requests to it go unanswered like to a pump that is offline
+    silent = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    silent.bind(('127.0.0.1', 0))
+    offline_devices = []
+    for i in range(unreachable):
+        handler = AlsavoPro(f"offline {i}", str(i), '127.0.0.1', silent.getsockname()[1], DEFAULT_PASSWORD)
+        offline_devices.append(_Device(handler, AlsavoProDataCoordinator(hass, handler)))
+    semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def first_poll(device):
+        async with semaphore:
+            await device.handler.update()
+    await asyncio.gather(*[first_poll(device) for device in fleet_devices])
+    memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    fleet = AlsavoProFleet(interval, max_concurrency)
+    lags = []
+    probe = asyncio.ensure_future(_probe_lag(lags))
+    cpu_started = time.process_time()
+    started = time.monotonic()
+    for i, device in enumerate(fleet_devices + offline_devices):
+        fleet.add(i, device.refresh, lambda: interval)
+    # Every fleet cycle completed while running, sampled twice per interval so none is missed
+    cycles = []
+    while (remaining := started + duration - time.monotonic()) > 0:
+        await asyncio.sleep(min(interval / 2, remaining))
+        if fleet.last_cycle is not None and (not cycles or cycles[-1] is not fleet.last_cycle):
+            cycles.append(fleet.last_cycle)
+    elapsed = time.monotonic() - started
+    cpu = time.process_time() - cpu_started
+    fleet.stop()
+    probe.cancel()
+    drift.cancel()
+
+    polls = sum(device.polls for device in fleet_devices)
+    # Ticks due since each device's first poll for which no poll started
+    missed = sum(max(0, math.ceil((started + elapsed - device.first_poll) / interval) - device.started)
+                 for device in fleet_devices if device.first_poll is not None)
+    missed += sum(1 for device in fleet_devices if device.first_poll is None)
+    files = _open_files()
+    for device in fleet_devices + offline_devices:
+        device.handler.close()
+    silent.close()
+    for simulator in simulators:
+        simulator.transport.close()
+
+    return {
+        'devices': devices,
+        'shared_socket': shared,
+        'duration': elapsed,
+        'interval': interval,
+        'polls': polls,
+        'polls_per_sec': polls / elapsed,
+        'target_polls_per_sec': devices / interval,
+        'failed_polls': sum(device.failures for device in fleet_devices),
+        'unreachable_polls': sum(device.polls for device in offline_devices),
+        'fleet_cycle_failures': sum(cycle.failures for cycle in cycles),
+        'missed_ticks': missed,
+        'loop_lag_p50_ms': (percentile(lags, 50) or 0) * 1000,
+        'loop_lag_p99_ms': (percentile(lags, 99) or 0) * 1000,
+        'loop_lag_max_ms': max(lags, default=0) * 1000,
+        'cpu_ms_per_poll': cpu * 1000 / polls if polls else None,
+        'cpu_utilization': cpu / elapsed,
+        'memory_kib_per_device': memory / 1024 / devices,
+        'max_rss_mib': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        'open_files': files,
+        'last_cycle': repr(fleet.last_cycle),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--devices', type=int, default=200)
+    parser.add_argument('--duration', type=float, default=60.0, help="seconds of polling after setup")
+    parser.add_argument('--interval', type=float, default=15.0, help="poll interval of every device")
+    parser.add_argument('--shared', action='store_true',
+                        help="serve all pumps on one port and poll them over one socket, like the cloud relay")
+    parser.add_argument('--max-concurrency', type=int, default=FLEET_MAX_CONCURRENT_POLLS)
+    parser.add_argument('--unreachable', type=int, default=0, help="additional pumps that never answer")
+    parser.add_argument('--json', action='store_true', help="print the report as JSON")
+    args = parser.parse_args(argv)
+
+    report = asyncio.run(run(args.devices, args.duration, args.interval, args.shared, args.max_concurrency,
+                             unreachable=args.unreachable))
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        for key, value in report.items():
+            print(f"{key:24} {value:.3f}" if isinstance(value, float) else f"{key:24} {value}")
+
+
+if __name__ == '__main__':
+    main()
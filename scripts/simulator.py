@@ -0,0 +1,289 @@
+"""Simulated Alsavo Pro heat pumps speaking the UDP protocol.
+
+Serves any number of virtual pumps, each on its own port like a local pump, or all behind one port like
+the cloud relay, where the serial number in the handshake selects the pump:
+
+    python -m scripts.simulator --pumps 1000 --port 51192 --shared
+
+The register file of every pump lives in memory; queries read it and set_config writes to it.
+"""
+import argparse
+import asyncio
+import hashlib
+import itertools
+import logging
+import random
+import sys
+from array import array
+from collections import deque
+
+from custom_components.alsavopro.codec import PacketHeader, AuthIntro, AuthChallenge, AuthResponse, HDR_REPLY, \
+    CMD_AUTH, CMD_DATA, KIND_STATUS, KIND_CONFIG, KIND_ALL, HEADER, decode_query, decode_set_configs, \
+    encode_query_response
+
+_LOGGER = logging.getLogger(__name__)
+
+STATUS_REGISTERS = 70
+CONFIG_REGISTERS = 17
+DEFAULT_PASSWORD = "simulator"
+DEFAULT_SERIAL = 1000
+# Sessions a pump remembers, older ones are rejected like on a real pump
+MAX_SESSIONS_PER_PUMP = 4
+
+# Auth acts, the first byte of an auth payload
+_ACT_INTRO = 1
+_ACT_RESPONSE = 4
+_AUTH_OK = (5).to_bytes(4, 'little')
+_AUTH_FAILED = (0).to_bytes(4, 'little')
+_QUERY = 0x08
+_SET_CONFIG = 0x09
+
+_SWAP = sys.byteorder == 'little'
+
+
+def _to_bytes(values):
+    """ Big-endian wire representation of an array('H') """
+    values = array('H', values)
+    if _SWAP:
+        values.byteswap()
+    return values.tobytes()
+
+
+class VirtualPump:
+    """ Register file of one simulated heat pump """
+    """ Starts powered on in heating mode at a 28 degree setpoint. step() lets the temperatures and the """
+    """ compressor frequency drift, seeded by the serial number so runs are reproducible. """
+
+    def __init__(self, serial, password=DEFAULT_PASSWORD, ack_writes=True):
+        self.serial = serial
+        self.dsid = serial & 0xffffffff
+        self.password_hash = hashlib.md5(password.encode()).digest()
+        self.ack_writes = ack_writes
+        self.status = array('H', [0]) * STATUS_REGISTERS
+        self.config = array('H', [0]) * CONFIG_REGISTERS
+        self.device_info = array('H', [1, 2])
+        self.csids = deque()
+        self.queries = 0
+        self.writes = 0
+        self._random = random.Random(serial)
+
+        # Water in, water out, ambient, pipes, IPM, fan, exhaust, valve and current
+        for idx, value in ((16, 265), (17, 280), (18, 150), (19, 80), (20, 450), (21, 400), (22, 650),
+                           (23, 700), (25, 300), (26, 5), (27, 60)):
+            self.status[idx] = value
+        # Setpoint limits and HW/SW revision
+        for idx, value in ((55, 400), (56, 150), (64, 1), (65, 3), (66, 7)):
+            self.status[idx] = value
+        # Heating, cooling and auto setpoints, power on in heating mode, power mode
+        for idx, value in ((1, 280), (2, 240), (3, 270), (4, 33), (16, 1)):
+            self.config[idx] = value
+
+    @property
+    def is_power_on(self):
+        return self.config[4] & 32 == 32
+
+    def read(self, windows):
+        """ Query response parts for (kind, start_idx, count) windows """
+        parts = []
+        for kind, start_idx, count in windows:
+            if kind == KIND_ALL:
+                parts.append((KIND_STATUS, 0, _to_bytes(self.status)))
+                parts.append((KIND_CONFIG, 0, _to_bytes(self.config)))
+                parts.append((3, 0, _to_bytes(self.device_info)))
+            elif kind == KIND_STATUS or kind == KIND_CONFIG:
+                registers = self.status if kind == KIND_STATUS else self.config
+                parts.append((kind, start_idx, _to_bytes(registers[start_idx:start_idx + count])))
+        self.queries += 1
+        return parts
+
+    def write(self, values):
+        """ Apply a set_config, registers outside the config block are ignored """
+        for idx, value in values.items():
+            if idx < CONFIG_REGISTERS:
+                self.config[idx] = value
+        self.writes += 1
+
+    def step(self):
+        """ Advance the simulated state by one tick """
+        if self.is_power_on:
+            target = self.config[1]
+            self.status[27] = min(max(self.status[27] + self._random.randint(-5, 5), 30), 90)
+            self.status[16] += (target > self.status[16]) - (target < self.status[16])
+            self.status[17] = self.status[16] + 15
+        else:
+            self.status[27] = 0
+        self.status[18] = (self.status[18] + self._random.randint(-1, 1)) & 0xffff
+
+
+class _Session:
+    __slots__ = ('pump', 'client_token', 'server_token', 'authenticated')
+
+    def __init__(self, pump, client_token, server_token):
+        self.pump = pump
+        self.client_token = client_token
+        self.server_token = server_token
+        self.authenticated = False
+
+
+class PumpSimulator(asyncio.DatagramProtocol):
+    """ UDP endpoint serving one or more virtual pumps """
+    """ Sessions are keyed by CSID, so pumps behind the same port don't see each other's packets. """
+
+    def __init__(self, pumps, seed=0):
+        self.pumps = {pump.serial: pump for pump in pumps}
+        self.transport = None
+        self.sessions = {}
+        self.received = 0
+        self.rejected = 0
+        self._random = random.Random(seed)
+        self._csids = itertools.count(self._random.randrange(1, 0x10000))
+
+    @property
+    def port(self):
+        return self.transport.get_extra_info('sockname')[1]
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data, addr):
+        self.received += 1
+        reply = self.handle(data)
+        if reply is not None:
+            self.transport.sendto(reply, addr)
+
+    def handle(self, data):
+        """ Reply to one datagram, None if it is not answered """
+        if data.__len__() < HEADER.size:
+            return None
+        hdr = PacketHeader.unpack(data)
+        if hdr.cmd == CMD_AUTH and data.__len__() > HEADER.size:
+            if data[HEADER.size] == _ACT_INTRO:
+                return self._challenge(AuthIntro.unpack(data))
+            if data[HEADER.size] == _ACT_RESPONSE:
+                return self._authenticate(AuthResponse.unpack(data))
+            return None
+        if hdr.cmd == CMD_DATA:
+            return self._data(hdr, memoryview(data)[HEADER.size:HEADER.size + hdr.payloadLength])
+        return None
+
+    def _challenge(self, intro):
+        pump = self.pumps.get(intro.pumpSerial)
+        if pump is None:
+            # Not authorized, the client gives up on this serial
+            return AuthChallenge(PacketHeader(HDR_REPLY, 0, 0, 0, CMD_AUTH, 8), 0, 0, 0, 0, 0).pack()
+        csid = next(self._csids) & 0xffffffff
+        self.sessions[csid] = _Session(pump, intro.clientToken, self._random.getrandbits(32))
+        pump.csids.append(csid)
+        if pump.csids.__len__() > MAX_SESSIONS_PER_PUMP:
+            self.sessions.pop(pump.csids.popleft(), None)
+        return AuthChallenge(PacketHeader(HDR_REPLY, 0, csid, pump.dsid, CMD_AUTH, 8), 3, 0, 0, 0,
+                             self.sessions[csid].server_token).pack()
+
+    def _authenticate(self, response):
+        csid = response.hdr.csid
+        session = self.sessions.get(csid)
+        if session is None:
+            return None
+        ctx = hashlib.md5()
+        ctx.update(session.client_token.to_bytes(4, 'big'))
+        ctx.update(session.server_token.to_bytes(4, 'big'))
+        ctx.update(session.pump.password_hash)
+        session.authenticated = ctx.digest() == response.response
+        act = _AUTH_OK if session.authenticated else _AUTH_FAILED
+        if not session.authenticated:
+            del self.sessions[csid]
+        return PacketHeader(HDR_REPLY, 0, csid, session.pump.dsid, CMD_AUTH, act.__len__()).pack() + act
+
+    def _data(self, hdr, payload):
+        session = self.sessions.get(hdr.csid)
+        if session is None or not session.authenticated or not payload:
+            # Unknown session, answered with another command so the client re-authenticates
+            _LOGGER.debug(f"Rejecting packet of unknown session {hdr.csid:#x}")
+            self.rejected += 1
+            return PacketHeader(HDR_REPLY, hdr.seq, hdr.csid, hdr.dsid, CMD_AUTH, 0).pack()
+        pump = session.pump
+        if payload[0] == _QUERY:
+            body = encode_query_response(_QUERY, pump.read(decode_query(payload)))
+        elif payload[0] == _SET_CONFIG:
+            pump.write(decode_set_configs(payload))
+            if not pump.ack_writes:
+                return None
+            body = b''
+        else:
+            return None
+        return PacketHeader(HDR_REPLY, hdr.seq, hdr.csid, pump.dsid, CMD_DATA, body.__len__()).pack() + body
+
+    def step(self):
+        for pump in self.pumps.values():
+            pump.step()
+
+
+def create_pumps(count, serial_base=DEFAULT_SERIAL, password=DEFAULT_PASSWORD, ack_writes=True):
+    return [VirtualPump(serial_base + i, password, ack_writes) for i in range(count)]
+
+
+async def serve(pumps, host='127.0.0.1', port=0, seed=0):
+    """ Serve pumps on one UDP port, 0 picks a free one """
+    _, simulator = await asyncio.get_running_loop().create_datagram_endpoint(
+        lambda: PumpSimulator(pumps, seed),
+        local_addr=(host, port)
+    )
+    return simulator
+
+
+async def serve_fleet(pumps, host='127.0.0.1', port=0, shared=False, seed=0):
+    """ Serve pumps behind one shared port, or each on its own port counting up from port """
+    """ With port 0 every pump gets a free port. Returns the simulators, one per port. """
+    if shared:
+        return [await serve(pumps, host, port, seed)]
+    return [await serve([pump], host, port + i if port else 0, seed + i) for i, pump in enumerate(pumps)]
+
+
+async def run_drift(simulators, interval):
+    """ Step all pumps every interval seconds """
+    while True:
+        await asyncio.sleep(interval)
+        for simulator in simulators:
+            simulator.step()
+
+
+async def _main(args):
+    pumps = create_pumps(args.pumps, args.serial_base, args.password, not args.no_ack_writes)
+    simulators = await serve_fleet(pumps, args.host, args.port, args.shared, args.seed)
+    ports = f"port {simulators[0].port}" if simulators.__len__() == 1 else \
+        f"ports {simulators[0].port}-{simulators[-1].port}"
+    print(f"Serving {pumps.__len__()} pumps (serials {args.serial_base}-{args.serial_base + args.pumps - 1}) "
+          f"on {args.host} {ports}, password {args.password!r}")
+    try:
+        if args.drift_interval:
+            await run_drift(simulators, args.drift_interval)
+        else:
+            await asyncio.Event().wait()
+    finally:
+        for simulator in simulators:
+            simulator.transport.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--pumps', type=int, default=1, help="number of virtual pumps")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=1194, help="first port, 0 picks free ports")
+    parser.add_argument('--shared', action='store_true', help="serve all pumps on one port like the cloud relay")
+    parser.add_argument('--serial-base', type=int, default=DEFAULT_SERIAL, help="serial number of the first pump")
+    parser.add_argument('--password', default=DEFAULT_PASSWORD)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--drift-interval', type=float, default=5.0,
+                        help="seconds between state changes, 0 keeps the registers fixed")
+    parser.add_argument('--no-ack-writes', action='store_true', help="don't reply to set_config")
+    parser.add_argument('-v', '--verbose', action='store_true')
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.DEBUG if args.verbose else logging.INFO)
+    try:
+        asyncio.run(_main(args))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()